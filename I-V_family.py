@@ -0,0 +1,130 @@
+from tek371 import Tek371, RunWriter, RunReader, get_sink
+from tek371.sim import SimulatedTek371Resource
+from tek371.session import get_pool
+from tek371.postprocess import write_summary
+from tek371.catalog import Catalog
+from time import sleep
+import warnings
+
+# Suppress only the specific PyVISA warning
+warnings.filterwarnings("ignore", message="read string doesn't end with termination characters")
+
+
+# TEK371 constants
+tek371_gpib_address = "GPIB0::23::INSTR"
+tek371_horizontal_scale = 200E-3  # in V/DIV
+tek371_vertical_scale = 5  # in A/DIV
+tek371_vce_percentage = 100.0  # in %
+
+# Step generator constants, it drives the gate: one curve per Vge = (offset + k) * step, k = 0...steps
+tek371_step_voltage = 2  # in V/step
+tek371_step_offset = 5  # in steps, 0...5 (0...500 with step multiplication ON), i.e. 10 V
+tek371_step_number = 5  # 0...5, so Vge = 10, 12, ..., 20 V
+
+# Device under test constants
+folder = "E:/Miquel_Tutu/H40ER5S/H40ER5S_dev10_2025-12-01"
+DUT = "H40ER5S"
+dev = "dev10"
+temperature_applied = "120"
+file = f"{DUT}_{dev}_family_{temperature_applied}C"
+number_of_sweeps = 10
+curve_export = "none"  # csv | binary | raw | none, one file per curve besides the run file
+simulate = False  # run against the in-process simulator of tek371.sim instead of the GPIB bus
+catalog_file = "~/.tek371/catalog.sqlite"  # local index of every run, query it with tek371.catalog
+
+
+def main():
+    if simulate:
+        tek371_resource = SimulatedTek371Resource()
+    else:
+        tek371_resource = tek371_gpib_address
+
+        # Scan GPIB bus for all connected devices (useful to be sure the PC is connected to the right bus...)
+        resources = get_pool().list_resources()
+        print("GPIB SCAN")
+        for r in resources:
+            if "GPIB" in r:
+                print("  ", r)
+
+    print("-" * 50)
+    print("CONNECTED DEVICES")
+
+    # Initialize, reset and config tracer
+    tek = Tek371(tek371_resource)
+    print(f"Tracer connected at address {tek371_gpib_address.split('::')[1]}: {tek.id_string()}")
+    print("-" * 50)
+    # Send the whole configuration as a few semicolon-joined messages
+    with tek.batch():
+        tek.initialize()
+        tek.set_peak_power(300)
+        # Step generator drives the gate, one curve per step
+        tek.set_step_number(tek371_step_number)
+        tek.set_step_voltage(tek371_step_voltage)
+        tek.set_step_offset(tek371_step_offset)
+        tek.enable_step_output("ON")
+        tek.set_horizontal("COL", tek371_horizontal_scale)  # 200 mV/div
+        tek.set_vertical(tek371_vertical_scale)  # 5 A/div
+        tek.set_display_mode("STO")
+    tek.enable_srq_event()
+    print("\nCRT SETTINGS")
+    print(f"  Horizontal scale set to: {tek.get_horizontal().split(':')[1]} V/DIV")
+    print(f"  Vertical scale set to: {tek.get_vertical().split(':')[1]} A/DIV")
+    print(f"  Steps: {tek371_step_number + 1} curves from {tek371_step_offset * tek371_step_voltage:g} V, "
+          f"{tek371_step_voltage} V/step\n")
+    sleep(0.5)
+
+    print("START OF MEASUREMENT")
+    print("-" * 50)
+    sink = get_sink(curve_export)
+    # Raw codes, preamble, step and settings of every curve, in a single file for the whole run
+    run = RunWriter(f"{folder}/{file}.t371", metadata={
+        "DUT": DUT, "dev": dev, "temperature": temperature_applied, "vce_percentage": tek371_vce_percentage,
+        "step_voltage": tek371_step_voltage, "step_offset": tek371_step_offset, "step_number": tek371_step_number})
+    steps = {}  # (label, step value) -> positions of the curves of the step in the run file
+    try:
+        for i in range(1, number_of_sweeps + 1):
+            print(f"SWEEP {i}/{number_of_sweeps}")
+            tek.set_collector_supply(tek371_vce_percentage)
+            tek.set_measurement_mode("SWE")
+            if tek.wait_for_srq(timeout_s=60.0):
+                print(f"  Sweep {i}/{number_of_sweeps} finished!")
+            else:
+                raise TimeoutError(f"  Sweep {i}/{number_of_sweeps} did not complete within timeout")
+
+            # Whole family in one transfer, split into one curve per step
+            family = tek.acquire_family(tek371_step_number + 1)
+            for k, curve in enumerate(family):
+                # Named after the gate voltage, or the step number if the preamble does not report it
+                label = f"step{k}" if curve.step is None else f"{curve.step:g}V"
+                position = run.append(curve, index=i, settings=tek.settings_snapshot())
+                sink.write(curve, f"{folder}/{file}_{label}_{i}{sink.extension}")
+                steps.setdefault((label, curve.step), []).append(position)
+            print("-" * 50)
+
+            # Reset SRQ for new sweep (the handler stays installed)
+            tek.arm()
+    finally:
+        # Also after an error or Ctrl-C: finish the run file and index the curves it holds
+        tek.disable_srq_event()
+        tek.close()
+        run.close()
+        with Catalog(catalog_file) as catalog:
+            catalog.register_run(run.filename)
+    print("I-V family acquisition done!\n")
+    print("Processing mean I-V files...")
+    # One mean file per gate voltage, from the repeats of the step resampled on a common current grid,
+    # indexed in the catalog with the curves
+    with Catalog(catalog_file) as catalog, RunReader(run.filename) as reader:
+        for (label, step), positions in steps.items():
+            curves = [reader.curve(position).points for position in positions]
+            mean_path, stats_path = write_summary(curves, folder, f"{file}_{label}", stats=True)
+            catalog.register_file(run.filename, mean_path, "mean", vge=step)
+            catalog.register_file(run.filename, stats_path, "stats", vge=step)
+            print(f"Mean file written: {mean_path}")
+            print(f"Statistics file written: {stats_path}")
+    print(f"Run registered in {catalog.filename}")
+    print("\nScript finished.")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,11 @@
-from tek371 import Tek371
-import pyvisa
-from pymeasure.instruments.keithley import Keithley2400
+from tek371 import Tek371, RunWriter, CurvePipeline, acquire_burst, get_sink
+from tek371.acquisition import BUBBLE_MEMORY_SIZE
+from tek371.sim import SimulatedTek371Resource, SimulatedKeithley2400
+from tek371.session import get_pool
+from tek371.postprocess import load_run_file, write_summary
+from tek371.catalog import Catalog
 from time import sleep
 import warnings
-import os
-import csv
 
 # Suppress only the specific PyVISA warning
 warnings.filterwarnings("ignore", message="read string doesn't end with termination characters")
@@ -29,62 +30,35 @@ vge_applied = "15"
 temperature_applied = "65"
 file = f"{DUT}_{dev}_{vge_applied}V_{temperature_applied}C_{tek371_vce_percentage}"
 number_of_curves = 10
-
-
-def compute_mean_file(folder_path: str, base_name: str, N: int):
-    """
-    Compute per-row mean of Voltage and Current across N files:
-    {folder}/{base_name}_1.csv ... {folder}/{base_name}_{N}.csv
-    Save result as {folder}/{base_name}_MEAN.csv.
-    """
-    filepaths = [os.path.join(folder_path, f"{base_name}_{i}.csv") for i in range(1, N + 1)]
-    rows_list = []
-
-    # Read all files into memory
-    for path in filepaths:
-        with open(path, newline='', encoding='utf-8') as f:
-            reader = csv.reader(f)
-            rows_list.append(list(reader))
-
-    # Compute means (skip header)
-    header = rows_list[0][0]
-    num_rows = len(rows_list[0])  # should be 257
-    mean_rows = [header]  # Set first row of mean CSV file to have the same header
-
-    for r in range(1, num_rows):
-        values_v = [float(rows_list[i][r][0]) for i in range(N)]  # Voltage values across all files
-        values_i = [float(rows_list[i][r][1]) for i in range(N)]  # Current values across all files
-        mean_v = sum(values_v) / N
-        mean_i = sum(values_i) / N
-        mean_rows.append([mean_v, mean_i])
-
-    # Create 'mean' subfolder if it doesn't exist
-    mean_folder = os.path.join(folder_path, "mean")
-    os.makedirs(mean_folder, exist_ok=True)
-
-    # Save mean file in the subfolder
-    out_path = os.path.join(mean_folder, f"{base_name}_MEAN.csv")
-    with open(out_path, 'w', newline='', encoding='utf-8') as f:
-        writer = csv.writer(f)
-        writer.writerows(mean_rows)
-
-    print(f"Mean file written: {out_path}")
+curve_export = "none"  # csv | binary | raw | none, one file per curve besides the run file
+burst_mode = False  # store the curves in the 371 bubble memory, download them after every 16
+simulate = False  # run against the in-process simulators of tek371.sim instead of the GPIB bus
+catalog_file = "~/.tek371/catalog.sqlite"  # local index of every run, query it with tek371.catalog
 
 
 def main():
-    # Scan GPIB bus for all connected devices (useful to be sure the PC is connected to the right bus...)
-    rm = pyvisa.ResourceManager()
-    resources = rm.list_resources()
-    print("GPIB SCAN")
-    for r in resources:
-        if "GPIB" in r:
-            print("  ", r)
+    if simulate:
+        Keithley2400 = SimulatedKeithley2400
+        tek371_resource = SimulatedTek371Resource()
+    else:
+        from pymeasure.instruments.keithley import Keithley2400
+        tek371_resource = tek371_gpib_address
+
+        # Scan GPIB bus for all connected devices (useful to be sure the PC is connected to the right bus...)
+        # The shared pool keeps the result for a while, so repeated runs do not rescan
+        resources = get_pool().list_resources()
+        print("GPIB SCAN")
+        for r in resources:
+            if "GPIB" in r:
+                print("  ", r)
 
     print("-" * 50)
     print("CONNECTED DEVICES")
 
     # Initialize, reset and config SMU
-    smu = Keithley2400(smu_gpib_address)
+    # The SMU object is kept in the pool, on its ResourceManager and VISA session, so later runs in the
+    # same process reuse them
+    smu = get_pool().instrument(smu_gpib_address, Keithley2400, visa_adapter=not simulate)
     print(f"SMU connected at address {smu_gpib_address.split('::')[1]}: {smu.id}")
     smu.reset()
     # SMU is only applying voltage, not measuring, so no need for SRQ
@@ -97,60 +71,102 @@ def main():
     sleep(0.5)
 
     # Initialize, reset and config tracer
-    tek = Tek371(tek371_gpib_address)
+    tek = Tek371(tek371_resource)
     print(f"Tracer connected at address {tek371_gpib_address.split('::')[1]}: {tek.id_string()}")
     print("-" * 50)
-    tek.initialize()
-    tek.set_peak_power(300)
-    # Step generator is not used, set to minimum
-    tek.set_step_number(0)
-    tek.set_step_voltage(200e-3)
-    tek.set_step_offset(0)
+    # Send the whole configuration as a few semicolon-joined messages
+    with tek.batch():
+        tek.initialize()
+        tek.set_peak_power(300)
+        # Step generator is not used, set to minimum
+        tek.set_step_number(0)
+        tek.set_step_voltage(200e-3)
+        tek.set_step_offset(0)
+        tek.set_horizontal("COL", tek371_horizontal_scale)  # 200 mV/div
+        tek.set_vertical(tek371_vertical_scale)  # 5 A/div
+        tek.set_display_mode("STO")
     tek.enable_srq_event()
-    tek.set_horizontal("COL", tek371_horizontal_scale)  # 200 mV/div
-    tek.set_vertical(tek371_vertical_scale)  # 5 A/div
     print("\nCRT SETTINGS")
     print(f"  Horizontal scale set to: {tek.get_horizontal().split(':')[1]} V/DIV")
     print(f"  Vertical scale set to: {tek.get_vertical().split(':')[1]} A/DIV\n")
-    tek.set_display_mode("STO")
     sleep(0.5)
 
     print("START OF MEASUREMENT")
     print("-" * 50)
-    smu.enable_source()
-    for i in range(1, number_of_curves+1):
-        print(f"SINGLE {i}/{number_of_curves}")
-        # Set Collector Supply to desired %
-        tek.set_collector_supply(tek371_vce_percentage)
-        print(f"  Collector supply set to: {tek.get_collector_supply().split()[-1]} %")
-
-        # Set measurement mode to sweep
-        tek.set_measurement_mode("SIN")
-
-        # Start the sweep
-        print(f"  Starting single number {i}/{number_of_curves}...")
-        if tek.wait_for_srq(timeout_s=60.0):
-            print(f"  Single {i}/{number_of_curves} finished!")
+    sink = get_sink(curve_export)
+    # Raw codes, preamble and settings of every curve, in a single file for the whole run
+    run = RunWriter(f"{folder}/{file}.t371", metadata={
+        "DUT": DUT, "dev": dev, "vge": vge_applied, "temperature": temperature_applied,
+        "vce_percentage": tek371_vce_percentage, "number_of_curves": number_of_curves})
+
+    def store_curve(i, curve, settings=None):
+        run.append(curve, index=i, settings=settings)
+        sink.write(curve, f"{folder}/{file}_{i}{sink.extension}")
+
+    # Curves are decoded and written by a background worker while the next sweep runs
+    pipeline = CurvePipeline(store_curve, keep_curves=False)
+    try:
+        smu.enable_source()
+        if burst_mode:
+            # All singles back-to-back stored in bubble memory, then one bulk download per burst
+            # The bubble memory holds 16 curves, so longer runs are taken as several bursts
+            for first in range(1, number_of_curves + 1, BUBBLE_MEMORY_SIZE):
+                count = min(BUBBLE_MEMORY_SIZE, number_of_curves - first + 1)
+                print(f"  Starting burst of {count} singles ({first}...{first + count - 1}/{number_of_curves})...")
+                burst = acquire_burst(tek, count, mode="SIN", timeout_s=60.0,
+                                      before_sweep=lambda n: tek.set_collector_supply(tek371_vce_percentage))
+                settings = tek.settings_snapshot()
+                for i, curve in enumerate(burst, start=first):
+                    pipeline.submit_curve(i, curve, settings=settings)
+            print("-" * 50)
         else:
-            raise TimeoutError(f"  Single {i}/{number_of_curves} did not complete within timeout")
-
-        # Read curve and save to CSV
-        filename = f"{folder}/{file}_{i}.csv"
-        tek.read_curve(filename)
-        print("-" * 50)
-
-        # Reset SRQ for new sweep
-        tek.discard_and_disable_all_events()
-        tek.enable_srq_event()
-
-    smu.disable_source()
+            for i in range(1, number_of_curves+1):
+                print(f"SINGLE {i}/{number_of_curves}")
+                # Set Collector Supply to desired %
+                tek.set_collector_supply(tek371_vce_percentage)
+                print(f"  Collector supply set to: {tek.get_collector_supply().split()[-1]} %")
+
+                # Set measurement mode to sweep
+                tek.set_measurement_mode("SIN")
+
+                # Start the sweep
+                print(f"  Starting single number {i}/{number_of_curves}...")
+                if tek.wait_for_srq(timeout_s=60.0):
+                    print(f"  Single {i}/{number_of_curves} finished!")
+                else:
+                    raise TimeoutError(f"  Single {i}/{number_of_curves} did not complete within timeout")
+
+                # Read curve (preamble and curve in a single WAV? query) and hand it to the pipeline
+                # Settings are snapshotted now, the worker may only store the curve during the next sweep
+                pipeline.submit(i, *tek.read_waveform_raw(), settings=tek.settings_snapshot())
+                print("-" * 50)
+
+                # Reset SRQ for new sweep (the handler stays installed)
+                tek.arm()
+    finally:
+        # Also after an error or Ctrl-C: switch the SMU off, finish the run file and index the curves it holds
+        smu.disable_source()
+        tek.disable_srq_event()
+        tek.close()
+        try:
+            pipeline.close()  # Wait for the last curves to be written
+        finally:
+            run.close()
+            with Catalog(catalog_file) as catalog:
+                catalog.register_run(run.filename)
     smu.beep(4000, 2)
-    tek.disable_srq_event()
-    tek.close()
     print("I-V curves acquisition done!\n")
     print("Processing mean I-V file...")
-    # After all curves are saved, compute the mean file
-    compute_mean_file(folder, file, number_of_curves)
+    # Every repeat is resampled on a common current grid, so each row of the mean is one operating point
+    mean_path, stats_path = write_summary(load_run_file(run.filename), folder, file, stats=True)
+    print(f"Mean file written: {mean_path}")
+    print(f"Statistics file written: {stats_path}")
+
+    # Index the mean files with the curves, so they can be found without walking the folders
+    with Catalog(catalog_file) as catalog:
+        catalog.register_file(run.filename, mean_path, "mean")
+        catalog.register_file(run.filename, stats_path, "stats")
+    print(f"Run registered in {catalog.filename}")
     print("\nScript finished.")
 
 
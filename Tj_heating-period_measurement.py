@@ -1,8 +1,9 @@
 # Import necessary packages
-from pymeasure.instruments.keithley import Keithley2400
 from time import sleep
 import time
 import sys
+from tek371.session import get_pool
+from tek371.sim import SimulatedKeithley2400
 
 
 def print_progress_bar(iteration, total, prefix='', suffix='', length=50, fill='█'):
@@ -27,6 +28,8 @@ vge_gpib_address = "GPIB::24"
 vge_source_voltage = 15  # in V
 vge_compliance_current = 1e-3  # in A
 
+simulate = False  # run against the simulated SMUs of tek371.sim instead of the GPIB bus
+
 measurement_duration = 15 * 60  # Total duration in seconds (15 minutes)
 interval = 1  # Desired interval between measurements in seconds
 
@@ -36,8 +39,14 @@ prefix = "temp_log"
 temperature_filename = "130"
 filename = f"{folder}/{prefix}_{temperature_filename}.txt"
 
+if simulate:
+    Keithley2400 = SimulatedKeithley2400
+else:
+    from pymeasure.instruments.keithley import Keithley2400
+
 # Initialize, reset and config VCE SMU
-smu_vce = Keithley2400(vce_gpib_address)
+# Both SMUs are kept in the shared pool, on its ResourceManager and VISA sessions
+smu_vce = get_pool().instrument(vce_gpib_address, Keithley2400, visa_adapter=not simulate)
 print("VCE SMU ID:", smu_vce.id)
 smu_vce.reset()
 smu_vce.use_front_terminals()
@@ -46,7 +55,7 @@ smu_vce.measure_voltage(vce_measure_nplc, vce_measure_voltage_range)
 smu_vce.wires = 4
 
 # Initialize, reset and config VGE SMU
-smu_vge = Keithley2400(vge_gpib_address)
+smu_vge = get_pool().instrument(vge_gpib_address, Keithley2400, visa_adapter=not simulate)
 print("VGE SMU ID:", smu_vge.id)
 smu_vge.reset()
 smu_vge.use_front_terminals()
@@ -1,5 +1,6 @@
-from pymeasure.instruments.keithley import Keithley2400
 from time import sleep
+from tek371.session import get_pool
+from tek371.sim import SimulatedKeithley2400
 
 # Keithley2400 (25): Applies constant Collector current and measures Collector-Emitter voltage
 vce_gpib_address = "GPIB::25"
@@ -13,8 +14,16 @@ vge_gpib_address = "GPIB::24"
 vge_source_voltage = 15  # in V
 vge_compliance_current = 1e-3  # in A
 
+simulate = False  # run against the simulated SMUs of tek371.sim instead of the GPIB bus
+
+if simulate:
+    Keithley2400 = SimulatedKeithley2400
+else:
+    from pymeasure.instruments.keithley import Keithley2400
+
 # Initialize, reset and config VCE SMU
-smu_vce = Keithley2400(vce_gpib_address)
+# Both SMUs are kept in the shared pool, on its ResourceManager and VISA sessions
+smu_vce = get_pool().instrument(vce_gpib_address, Keithley2400, visa_adapter=not simulate)
 print("VCE SMU ID:", smu_vce.id)
 smu_vce.reset()
 smu_vce.use_front_terminals()
@@ -23,7 +32,7 @@ smu_vce.measure_voltage(vce_measure_nplc, vce_measure_voltage_range)
 smu_vce.wires = 4
 
 # Initialize, reset and config VGE SMU
-smu_vge = Keithley2400(vge_gpib_address)
+smu_vge = get_pool().instrument(vge_gpib_address, Keithley2400, visa_adapter=not simulate)
 print("VGE SMU ID:", smu_vge.id)
 smu_vge.reset()
 smu_vge.use_front_terminals()
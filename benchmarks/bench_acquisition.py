@@ -0,0 +1,219 @@
+"""
+bench_acquisition.py
+Per-phase timing of the acquisition of I-V curves, run against the simulated TEK371 of tek371.sim.
+
+The tracer is configured once per run, then every curve is split in the phases below, each
+timed separately, as in I-V_measurement.py:
+    config            Configuration writes (INI, scales, step generator, NR.PT) in one batch, and SRQ
+                      enable; once per run
+    sweep_config      Settings written before every sweep (collector supply), skipped by the shadow
+                      state once they are on the instrument
+    srq_wait          MEA SWE until the SRQ handler wakes up wait_for_srq
+    preamble          WFM? query and parsing, from the cache after the first curve of a run
+    curve_transfer    CUR? query, exact-length binary read and checksum check
+    decode            Big-endian X/Y codes of the transferred block to scaled voltage/current
+    sort              Reordering of the points by ascending current
+    csv_write         CsvSink write of one curve
+    read_curve        Total of the preamble, curve_transfer, decode, sort and csv_write of the
+                      curve, i.e. what Tek371.read_curve does; every curve is transferred once
+    compute_mean_file Mean of all the CSV files of a run (tek371.postprocess)
+
+Usage:
+    python benchmarks/bench_acquisition.py --points 256 1024 --repeats 10 100 1000 --output bench.json
+
+The bus is ideal by default (no turnaround, unlimited throughput, immediate sweeps) so the
+numbers show the software cost of each phase; use --turnaround, --bytes-per-s and --sweep-time
+to model a real GPIB setup. The messages sent on the bus are counted by header, to show the
+coalesced configuration and the cached preamble.
+
+The curve sizes are the NR.PT the simulator returns for WFM NR.PT:<points>; the real 371
+chooses NR.PT from its own settings, so its curves may have other sizes.
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from tek371 import Tek371, Curve, CsvSink  # noqa: E402
+from tek371.curve import decode_codes, scale_codes  # noqa: E402
+from tek371.postprocess import compute_mean_file  # noqa: E402
+from tek371.sim import SimulatedTek371Resource  # noqa: E402
+
+PHASES = ("config", "sweep_config", "srq_wait", "preamble", "curve_transfer", "decode", "sort", "csv_write",
+          "read_curve", "compute_mean_file")
+# Phases of Tek371.read_curve, added up into read_curve
+READ_CURVE_PHASES = ("preamble", "curve_transfer", "decode", "sort", "csv_write")
+
+
+def _summary(samples: list) -> dict:
+    """Statistics of a list of durations, in seconds."""
+    ordered = sorted(samples)
+    return {
+        "n": len(ordered),
+        "mean_s": statistics.fmean(ordered),
+        "median_s": statistics.median(ordered),
+        "min_s": ordered[0],
+        "max_s": ordered[-1],
+        "p95_s": ordered[min(len(ordered) - 1, int(0.95 * len(ordered)))],
+        "stdev_s": statistics.stdev(ordered) if len(ordered) > 1 else 0.0,
+        "total_s": sum(ordered),
+    }
+
+
+POINTS_NOTE = ("Curve sizes are the NR.PT returned by the simulator for WFM NR.PT:<points>, "
+               "not measured on a real 371, which chooses NR.PT itself.")
+
+
+def configure(tek: Tek371, points: int) -> None:
+    """Configuration sent once at the start of a run, as in I-V_measurement.py."""
+    with tek.batch():
+        tek.initialize()
+        tek.set_peak_power(300)
+        tek.set_step_number(0)
+        tek.set_step_voltage(200e-3)
+        tek.set_step_offset(0)
+        tek.set_horizontal("COL", 200e-3)
+        tek.set_vertical(5)
+        tek.set_display_mode("STO")
+        tek.set_waveform_length(points)
+    # INI turns OPC off, so SRQ is enabled again after it (the handler stays installed)
+    tek.enable_srq_event()
+
+
+def run_case(points: int, repeats: int, args) -> dict:
+    """Acquire repeats curves of points points and time every phase."""
+    resource = SimulatedTek371Resource(sweep_time_s=args.sweep_time, turnaround_s=args.turnaround,
+                                       bytes_per_s=args.bytes_per_s, seed=args.seed)
+    tek = Tek371(resource, metrics=True)
+    sink = CsvSink()
+    samples = {phase: [] for phase in PHASES}
+    base_name = f"bench_{points}"
+
+    with tempfile.TemporaryDirectory() as folder:
+        t0 = time.perf_counter()
+        configure(tek, points)
+        samples["config"].append(time.perf_counter() - t0)
+
+        for i in range(1, repeats + 1):
+            filename = os.path.join(folder, f"{base_name}_{i}.csv")
+
+            t0 = time.perf_counter()
+            tek.set_collector_supply(100)
+            samples["sweep_config"].append(time.perf_counter() - t0)
+
+            t0 = time.perf_counter()
+            tek.arm()
+            tek.set_measurement_mode("SWE")
+            if not tek.wait_for_srq(timeout_s=args.sweep_time + 10.0):
+                raise TimeoutError(f"Simulated sweep {i} did not complete")
+            samples["srq_wait"].append(time.perf_counter() - t0)
+
+            t0 = time.perf_counter()
+            preamble = tek.get_preamble()
+            samples["preamble"].append(time.perf_counter() - t0)
+
+            t0 = time.perf_counter()
+            preamble, raw_curve = tek.read_curve_raw()
+            samples["curve_transfer"].append(time.perf_counter() - t0)
+
+            # Decoded from the bytes of the timed transfer, the curve is not read again
+            t0 = time.perf_counter()
+            codes = decode_codes(raw_curve, preamble.nr_pt)
+            unsorted = scale_codes(codes, preamble, sort=False)
+            samples["decode"].append(time.perf_counter() - t0)
+
+            t0 = time.perf_counter()
+            ordered = unsorted[np.argsort(unsorted[:, 1], kind="stable")]
+            samples["sort"].append(time.perf_counter() - t0)
+
+            curve = Curve(codes, preamble, time.time())
+            curve.points  # Scaled here, outside of the csv_write timing
+            t0 = time.perf_counter()
+            sink.write(curve, filename)
+            samples["csv_write"].append(time.perf_counter() - t0)
+
+            samples["read_curve"].append(sum(samples[phase][-1] for phase in READ_CURVE_PHASES))
+        tek.disable_srq_event()
+        # Messages actually sent, by header: one batch of configuration, one WFM? per run, one CUR? per curve
+        bus = {header: {op: stats[op]["count"] for op in ("write", "query", "read") if op in stats}
+               for header, stats in tek.metrics_snapshot()["commands"].items()}
+        tek.close()
+
+        for _ in range(args.mean_repeats):
+            t0 = time.perf_counter()
+            compute_mean_file(folder, base_name, repeats)
+            samples["compute_mean_file"].append(time.perf_counter() - t0)
+
+    return {
+        "points": points,
+        "repeats": repeats,
+        "curve_retries": tek.curve_retries,
+        "bus_messages": bus,
+        "phases": {phase: _summary(values) for phase, values in samples.items()},
+    }
+
+
+def main(argv=None) -> dict:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[2])
+    parser.add_argument("--points", type=int, nargs="+", default=[256, 512, 1024],
+                        help="Curve sizes (NR.PT), 1...1024")
+    parser.add_argument("--repeats", type=int, nargs="+", default=[10, 100, 1000],
+                        help="Number of curves acquired for every size")
+    parser.add_argument("--mean-repeats", type=int, default=3, help="Number of timed compute_mean_file runs")
+    parser.add_argument("--sweep-time", type=float, default=0.0, help="Simulated sweep time in s")
+    parser.add_argument("--turnaround", type=float, default=0.0, help="Simulated bus turnaround per write in s")
+    parser.add_argument("--bytes-per-s", type=float, default=0.0, help="Simulated bus throughput, 0 for unlimited")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the simulated noise")
+    parser.add_argument("--output", help="JSON output file, stdout if not given")
+    args = parser.parse_args(argv)
+
+    for points in args.points:
+        if not 1 <= points <= 1024:
+            parser.error(f"--points must be within 1...1024, got {points}")
+
+    logging.basicConfig(level=logging.WARNING)
+
+    print(POINTS_NOTE, file=sys.stderr)
+    results = []
+    for points in args.points:
+        for repeats in args.repeats:
+            print(f"Benchmarking {repeats} curves of {points} points...", file=sys.stderr)
+            results.append(run_case(points, repeats, args))
+
+    report = {
+        "benchmark": "acquisition",
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "platform": platform.platform(),
+        "points_note": POINTS_NOTE,
+        "simulator": {
+            "sweep_time_s": args.sweep_time,
+            "turnaround_s": args.turnaround,
+            "bytes_per_s": args.bytes_per_s,
+            "seed": args.seed,
+        },
+        "results": results,
+    }
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+        print(f"Results written: {args.output}", file=sys.stderr)
+    else:
+        print(text)
+    return report
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,38 @@
 from .instrument import Tek371
+from .preamble import Preamble, parse_preamble
+from .curve import Curve, ChecksumError, decode_curve, decode_family
+from .sinks import CsvSink, BinarySink, NullSink, get_sink
+from .acquisition import CurvePipeline, acquire_burst
+from .stats import CurveStatistics
+from .container import RunWriter, RunReader
+from .aio import AsyncTek371, AsyncKeithley2400
+from .metrics import Metrics
+from .session import SessionPool, get_pool
+from .sim import SimulatedTek371Resource, SimulatedKeithley2400
 
-__all__ = ["Tek371"]
+__all__ = [
+    "Tek371",
+    "Preamble",
+    "parse_preamble",
+    "Curve",
+    "ChecksumError",
+    "decode_curve",
+    "decode_family",
+    "CsvSink",
+    "BinarySink",
+    "NullSink",
+    "get_sink",
+    "CurvePipeline",
+    "acquire_burst",
+    "CurveStatistics",
+    "RunWriter",
+    "RunReader",
+    "AsyncTek371",
+    "AsyncKeithley2400",
+    "Metrics",
+    "SessionPool",
+    "get_pool",
+    "SimulatedTek371Resource",
+    "SimulatedKeithley2400",
+]
 __version__ = "0.1.0"
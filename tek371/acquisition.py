@@ -0,0 +1,187 @@
+"""
+acquisition.py
+Acquisition loops built on top of Tek371.
+"""
+import queue
+import threading
+import time
+
+from .curve import Curve
+
+import logging
+logger = logging.getLogger(__name__)
+
+BUBBLE_MEMORY_SIZE = 16  # Curve locations of the 371 mass storage
+
+
+class CurvePipeline:
+    """
+    Decodes and processes curves on a background worker, so the next sweep can be started
+    as soon as the bytes of the previous curve are in memory.
+
+    The queue between the acquisition loop and the worker is bounded: if processing falls
+    more than maxsize curves behind (e.g. a slow network drive), submit blocks until it catches up.
+
+    Example:
+        with CurvePipeline(lambda i, curve: sink.write(curve, f"{file}_{i}.csv")) as pipeline:
+            for i in range(1, n + 1):
+                ...  # start the sweep and wait for its SRQ
+                pipeline.submit(i, *tek.read_curve_raw())
+        curves = pipeline.curves
+
+    Args:
+        process: Called on the worker as process(index, curve, **context) for every curve, in submission
+            order, with the keyword arguments given to submit.
+        maxsize (int): Maximum number of curves waiting to be processed.
+        keep_curves (bool): Keep every decoded curve in .curves. Disable it when process already
+            consumes them (e.g. with CurveStatistics), so memory does not grow with the number of curves.
+    """
+
+    _STOP = object()
+
+    def __init__(self, process=None, maxsize: int = 4, keep_curves: bool = True):
+        self._process = process
+        self._keep_curves = keep_curves
+        self._queue = queue.Queue(maxsize=maxsize)
+        self._error = None
+        self.curves = []  # Decoded curves, in submission order (if keep_curves)
+        self._thread = threading.Thread(target=self._worker, name="CurvePipeline", daemon=True)
+        self._thread.start()
+
+    def submit(self, index: int, preamble, raw_curve: bytes, **context) -> None:
+        """
+        Queue a raw curve for decoding and processing.
+
+        Args:
+            index (int): Curve number, passed back to process.
+            preamble (str | Preamble): Preamble of the curve.
+            raw_curve (bytes): Full response to CUR?.
+            context: Passed back to process, e.g. the instrument settings at acquisition time, which
+                may have changed for the next sweep by the time the worker gets to the curve.
+
+        Raises:
+            Exception: Re-raises the first error of the worker, if any.
+        """
+        self._raise_worker_error()
+        self._queue.put((index, preamble, raw_curve, time.time(), None, context))
+
+    def submit_curve(self, index: int, curve: Curve, **context) -> None:
+        """
+        Queue an already decoded curve (e.g. from acquire_burst) for processing.
+
+        Raises:
+            Exception: Re-raises the first error of the worker, if any.
+        """
+        self._raise_worker_error()
+        self._queue.put((index, None, None, None, curve, context))
+
+    def close(self) -> list:
+        """
+        Wait for every queued curve to be processed and stop the worker.
+
+        Returns:
+            list: The decoded curves, in submission order (empty if keep_curves is False).
+
+        Raises:
+            Exception: Re-raises the first error of the worker, if any.
+        """
+        if self._thread.is_alive():
+            self._queue.put(self._STOP)
+            self._thread.join()
+        self._raise_worker_error()
+        return self.curves
+
+    def _worker(self) -> None:
+        while True:
+            item = self._queue.get()
+            if item is self._STOP:
+                return
+            if self._error is not None:
+                continue  # Keep draining so submit never blocks forever
+            index, preamble, raw_curve, timestamp, curve, context = item
+            try:
+                if curve is None:
+                    curve = Curve.from_raw(raw_curve, preamble, timestamp)
+                if self._process is not None:
+                    self._process(index, curve, **context)
+                if self._keep_curves:
+                    self.curves.append(curve)
+            except Exception as e:
+                logger.error("Processing of curve %s failed: %s", index, e)
+                self._error = e
+
+    def _raise_worker_error(self) -> None:
+        if self._error is not None:
+            raise self._error
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            # Do not hide the original error behind a processing one
+            try:
+                self.close()
+            except Exception:
+                pass
+
+
+def acquire_burst(tek, count: int, mode: str = "SWE", timeout_s: float = 60.0, first_index: int = 1,
+                  before_sweep=None) -> list:
+    """
+    Take up to 16 measurements back-to-back, storing each one in the 371 mass storage (ENT n),
+    and download them all afterwards (DIS VIE:n and WAV?).
+
+    No curve is transferred between measurements, so the time between repeats is as short and
+    as regular as possible. SRQ must have been enabled with enable_srq_event, and the display
+    must be in store mode.
+
+    Notes:
+        - The bubble memory locations first_index ... first_index + count - 1 are overwritten.
+        - The display is put back in store mode after the download.
+
+    Args:
+        tek (Tek371): Connected instrument.
+        count (int): Number of measurements.
+        mode (str): Measurement mode that starts each acquisition, "SWE", "SSW" or "SIN".
+        timeout_s (float): Maximum time to wait for each SRQ, in seconds.
+        first_index (int): First bubble memory location used.
+        before_sweep: Optional callable, called as before_sweep(n) before starting measurement n (1-based).
+
+    Returns:
+        list: The acquired Curve objects, in measurement order, timestamped when each was stored.
+
+    Raises:
+        ValueError: If the locations do not fit in the 16 of the bubble memory.
+        TimeoutError: If a measurement did not complete in time.
+    """
+    last_index = first_index + count - 1
+    if count < 1 or first_index < 1 or last_index > BUBBLE_MEMORY_SIZE:
+        raise ValueError(f"Burst of {count} curves from location {first_index} does not fit in bubble memory "
+                         f"1...{BUBBLE_MEMORY_SIZE}.")
+
+    # 1) Measure and store, without any curve transfer in between
+    timestamps = []
+    for n, index in enumerate(range(first_index, last_index + 1), start=1):
+        if before_sweep is not None:
+            before_sweep(n)
+        tek.arm()
+        tek.set_measurement_mode(mode)
+        if not tek.wait_for_srq(timeout_s=timeout_s):
+            raise TimeoutError(f"Burst measurement {n}/{count} did not complete within timeout")
+        tek.store_display(index)
+        timestamps.append(time.time())
+        logger.info("Burst measurement %s/%s stored in location %s", n, count, index)
+
+    # 2) Bulk download
+    curves = []
+    try:
+        for index, timestamp in zip(range(first_index, last_index + 1), timestamps):
+            tek.view_curve(index)
+            preamble, raw_curve = tek.read_waveform_raw()
+            curves.append(Curve.from_raw(raw_curve, preamble, timestamp))
+    finally:
+        tek.set_display_mode("STO")
+    return curves
@@ -0,0 +1,38 @@
+"""
+adapters.py
+PyMeasure adapter over a VISA session opened elsewhere, e.g. by the SessionPool.
+
+Imported on demand by SessionPool.visa_adapter, so PyMeasure is only needed by the
+scripts that drive PyMeasure instruments.
+"""
+from pymeasure.adapters import VISAAdapter
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+class PooledVISAAdapter(VISAAdapter):
+    """
+    VISAAdapter on an already open pyvisa session, which it does not own.
+
+    PyMeasure adapters close their connection when closed or garbage collected. The session
+    belongs to whoever opened it (the SessionPool), so close() leaves it open.
+
+    Example:
+        smu = Keithley2400(PooledVISAAdapter(pool.open_resource("GPIB::24"), pool.resource_manager))
+
+    Args:
+        session (pyvisa.resources.MessageBasedResource): The open session.
+        manager (pyvisa.ResourceManager): ResourceManager the session was opened with.
+        log (logging.Logger): Parent logger of the 'Adapter' logger, as for VISAAdapter.
+    """
+
+    def __init__(self, session, manager, log=None):
+        # VISAAdapter.__init__ opens a session of its own, so only the base Adapter is initialized
+        super(VISAAdapter, self).__init__(log=log)
+        self.resource_name = session.resource_name
+        self.connection = session
+        self.manager = manager
+
+    def close(self) -> None:
+        """Leave the session open for its owner, see SessionPool.close and SessionPool.discard."""
@@ -0,0 +1,166 @@
+"""
+aio.py
+asyncio front-end for the TEK371 driver and the Keithley 2400 SMUs used by the scripts.
+
+Every instrument gets its own single-thread executor: calls to one instrument run in order,
+while calls to different instruments overlap, so one event loop can configure the gate SMU,
+read temperature and wait for a sweep at the same time.
+"""
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+from .instrument import Tek371
+from .session import get_pool
+
+
+class AsyncInstrument:
+    """
+    Runs the blocking calls of a wrapped instrument object in a dedicated executor.
+
+    Methods of the wrapped object are available as coroutines, e.g. "await smu.enable_source()".
+    Properties, which do GPIB I/O when read or written on PyMeasure instruments, go through get and set.
+    """
+
+    def __init__(self, instrument, name: str = None):
+        self.instrument = instrument
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix=name or type(instrument).__name__)
+
+    async def run(self, func, *args, **kwargs):
+        """Run func(*args, **kwargs) in the instrument executor and await its result."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, functools.partial(func, *args, **kwargs))
+
+    async def get(self, name: str):
+        """Read an attribute or property of the instrument."""
+        return await self.run(getattr, self.instrument, name)
+
+    async def set(self, name: str, value) -> None:
+        """Write an attribute or property of the instrument."""
+        await self.run(setattr, self.instrument, name, value)
+
+    def __getattr__(self, name: str):
+        if name.startswith("_") or name == "instrument":
+            raise AttributeError(name)
+        # Look the name up on the class so that properties are not read (and do not do I/O) here
+        attribute = getattr(type(self.instrument), name, None)
+        if isinstance(attribute, property):
+            raise AttributeError(f"'{name}' is a property, use 'await get(\"{name}\")' or 'await set(\"{name}\", value)'.")
+        method = getattr(self.instrument, name)
+        if not callable(method):
+            raise AttributeError(f"'{name}' is not a method, use 'await get(\"{name}\")'.")
+
+        @functools.wraps(method)
+        async def wrapper(*args, **kwargs):
+            return await self.run(method, *args, **kwargs)
+
+        return wrapper
+
+    async def close(self) -> None:
+        """Stop the executor once the calls already submitted have finished, without blocking the event loop."""
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, functools.partial(self._executor.shutdown, wait=True))
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+
+class AsyncTek371(AsyncInstrument):
+    """
+    asyncio front-end for Tek371.
+
+    Example:
+        tek = await AsyncTek371.open("GPIB0::23::INSTR")
+        await tek.enable_srq_event()
+        curve = await tek.sweep_and_acquire("SWE")
+    """
+
+    def __init__(self, tek: Tek371):
+        super().__init__(tek, name="Tek371")
+
+    @classmethod
+    async def open(cls, resource: str, **kwargs) -> "AsyncTek371":
+        """Open the instrument without blocking the event loop. kwargs are passed to Tek371."""
+        loop = asyncio.get_running_loop()
+        tek = await loop.run_in_executor(None, functools.partial(Tek371, resource, **kwargs))
+        return cls(tek)
+
+    async def wait_for_srq(self, timeout_s: float = 30.0) -> bool:
+        """
+        Wait until SRQ arrives (sweep complete), or timeout.
+
+        Runs outside the instrument executor, so already queued I/O is not held up by the wait.
+
+        Returns:
+            True if SRQ received before timeout, False otherwise.
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, functools.partial(self.instrument.wait_for_srq, timeout_s=timeout_s))
+
+    async def sweep(self, mode: str = "SWE", timeout_s: float = 60.0) -> None:
+        """
+        Start a measurement and wait for its SRQ. SRQ must have been enabled with enable_srq_event.
+
+        Args:
+            mode (str): Measurement mode that starts the acquisition, "SWE", "SSW" or "SIN".
+            timeout_s (float): Maximum time to wait for the SRQ, in seconds.
+
+        Raises:
+            TimeoutError: If the SRQ did not arrive in time.
+        """
+        self.instrument.arm()
+        await self.run(self.instrument.set_measurement_mode, mode)
+        if not await self.wait_for_srq(timeout_s=timeout_s):
+            raise TimeoutError(f"Measurement {mode} did not complete within {timeout_s} s")
+
+    async def read_curve(self, filename: str, sink=None):
+        """Read the curve and save it to filename (CSV by default). Returns the Curve."""
+        return await self.run(self.instrument.read_curve, filename, sink)
+
+    async def sweep_and_acquire(self, mode: str = "SWE", timeout_s: float = 60.0):
+        """Start a measurement, wait for it and return the acquired Curve."""
+        await self.sweep(mode, timeout_s)
+        return await self.run(self.instrument.acquire_curve)
+
+    async def close(self) -> None:
+        """Close the instrument and stop the executor."""
+        await self.run(self.instrument.close)
+        await super().close()
+
+
+class AsyncKeithley2400(AsyncInstrument):
+    """
+    asyncio front-end for a PyMeasure Keithley2400.
+
+    Example:
+        smu = AsyncKeithley2400(Keithley2400("GPIB::24"))
+        await smu.set("source_voltage", 15)
+        await smu.enable_source()
+    """
+
+    def __init__(self, smu):
+        super().__init__(smu, name="Keithley2400")
+
+    async def buffered_mean_voltage(self, count: int = 10) -> float:
+        """
+        Take count buffered voltage measurements and return their mean, as in the Tj scripts.
+        The source and measurement must already be configured.
+        """
+        def _measure():
+            self.instrument.config_buffer(count)
+            self.instrument.start_buffer()
+            self.instrument.wait_for_buffer()
+            return self.instrument.mean_voltage
+
+        return await self.run(_measure)
+
+    async def close(self) -> None:
+        """Release the VISA session, unless it belongs to the SessionPool, and stop the executor."""
+        adapter = self.instrument.adapter
+        # Pooled sessions stay open for the other users of the pool, as in Tek371.close
+        if not get_pool().owns(getattr(adapter, "connection", None)):
+            await self.run(adapter.close)
+        await super().close()
@@ -0,0 +1,344 @@
+"""
+catalog.py
+Local SQLite catalog of the acquired runs, curves and mean files.
+
+Every curve is registered with the parameters set at the top of the acquisition scripts
+(DUT, device, Vge, temperature, collector supply %), as indexed columns, and with its
+location (run file, position and byte offset of its codes) and CRC-32. Finding curves is
+then a single indexed query, with no directory walking over the network.
+
+Example:
+    with Catalog() as catalog:
+        entries = catalog.find(dev="dev10", temperature=120)
+        curves = catalog.load_curves(entries)
+
+Offline usage:
+    python -m tek371.catalog register <run file.t371> ...
+    python -m tek371.catalog find [--dut D] [--dev D] [--vge V] [--temperature T] [--vce-percentage P] [--kind K]
+"""
+import argparse
+import json
+import os
+import sqlite3
+import time
+import zlib
+from dataclasses import dataclass
+from typing import Optional
+
+from .container import RunReader
+
+import logging
+logger = logging.getLogger(__name__)
+
+DEFAULT_PATH = os.path.join("~", ".tek371", "catalog.sqlite")
+
+PARAMETERS = ("dut", "dev", "vge", "temperature", "vce_percentage")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY,
+    path TEXT NOT NULL UNIQUE,
+    dut TEXT,
+    dev TEXT,
+    vge REAL,
+    temperature REAL,
+    vce_percentage REAL,
+    registered REAL NOT NULL,
+    metadata TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS entries (
+    id INTEGER PRIMARY KEY,
+    run_id INTEGER NOT NULL REFERENCES runs (id) ON DELETE CASCADE,
+    kind TEXT NOT NULL,
+    dut TEXT,
+    dev TEXT,
+    vge REAL,
+    temperature REAL,
+    vce_percentage REAL,
+    path TEXT NOT NULL,
+    position INTEGER,
+    offset INTEGER,
+    nr_pt INTEGER,
+    curve_index INTEGER,
+    step REAL,
+    timestamp REAL,
+    crc32 INTEGER
+);
+CREATE INDEX IF NOT EXISTS entries_run ON entries (run_id);
+CREATE INDEX IF NOT EXISTS entries_dut ON entries (dut);
+CREATE INDEX IF NOT EXISTS entries_dev ON entries (dev, temperature);
+CREATE INDEX IF NOT EXISTS entries_vge ON entries (vge);
+CREATE INDEX IF NOT EXISTS entries_temperature ON entries (temperature);
+CREATE INDEX IF NOT EXISTS entries_vce_percentage ON entries (vce_percentage);
+"""
+
+# Run file metadata key of every parameter, as written by the acquisition scripts
+_METADATA_KEYS = {"dut": "DUT", "dev": "dev", "vge": "vge", "temperature": "temperature",
+                  "vce_percentage": "vce_percentage"}
+
+
+@dataclass(frozen=True)
+class CatalogEntry:
+    """
+    A registered curve or file.
+
+    Attributes:
+        kind (str): "curve" for a curve of a run file, "mean" or "stats" for the files of the mean folder.
+        dut, dev (str): Device under test and device.
+        vge (float): Gate voltage in V (the step value for the curves of a family).
+        temperature (float): Applied temperature in °C.
+        vce_percentage (float): Collector supply in %.
+        path (str): Run file of a curve, or the file itself.
+        position (int): Position of the curve in the run file, for RunReader.
+        offset (int): Byte offset of the raw little-endian uint16 codes of the curve in the run file.
+        nr_pt (int): Number of points of the curve.
+        curve_index (int): Curve number within the run.
+        step (float): Step generator value of the curve, for the curves of a family.
+        timestamp (float): Acquisition time of the curve, in seconds since the epoch.
+        crc32 (int): CRC-32 of the codes of a curve, or of the whole file.
+    """
+    kind: str
+    dut: Optional[str]
+    dev: Optional[str]
+    vge: Optional[float]
+    temperature: Optional[float]
+    vce_percentage: Optional[float]
+    path: str
+    position: Optional[int] = None
+    offset: Optional[int] = None
+    nr_pt: Optional[int] = None
+    curve_index: Optional[int] = None
+    step: Optional[float] = None
+    timestamp: Optional[float] = None
+    crc32: Optional[int] = None
+
+
+_ENTRY_COLUMNS = ", ".join(CatalogEntry.__dataclass_fields__)
+
+
+def _number(value) -> Optional[float]:
+    """Script parameters are often strings ("120"); keep them as numbers so they compare as such."""
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _file_crc32(path: str) -> int:
+    crc = 0
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            crc = zlib.crc32(chunk, crc)
+    return crc
+
+
+class Catalog:
+    """
+    SQLite catalog of runs, created on first use.
+
+    Args:
+        filename (str): Path of the database. Defaults to ~/.tek371/catalog.sqlite, on the local disk.
+    """
+
+    def __init__(self, filename: str = DEFAULT_PATH):
+        self.filename = os.path.expanduser(filename)
+        os.makedirs(os.path.dirname(os.path.abspath(self.filename)), exist_ok=True)
+        self._conn = sqlite3.connect(self.filename)
+        self._conn.execute("PRAGMA foreign_keys = ON")
+        self._conn.executescript(_SCHEMA)
+
+    def register_run(self, run_file: str, **parameters) -> int:
+        """
+        Register every curve of a run file (see container.py).
+
+        The parameters are taken from the run metadata, and can be given or overridden as keyword
+        arguments (dut, dev, vge, temperature, vce_percentage). Registering a run file again
+        replaces its previous curves, as when a run is repeated with the same file name.
+
+        Args:
+            run_file (str): Path of the run file.
+
+        Returns:
+            int: Number of curves registered.
+        """
+        path = os.path.abspath(run_file)
+        with RunReader(path) as run:
+            metadata = run.metadata
+            values = {name: metadata.get(key) for name, key in _METADATA_KEYS.items()}
+            values.update(parameters)
+            values["dut"] = None if values["dut"] is None else str(values["dut"])
+            values["dev"] = None if values["dev"] is None else str(values["dev"])
+            for name in ("vge", "temperature", "vce_percentage"):
+                values[name] = _number(values[name])
+
+            rows = []
+            for position in range(len(run)):
+                record = run.record(position)
+                step = run.curve_metadata(position).get("step")
+                rows.append(CatalogEntry(
+                    kind="curve",
+                    dut=values["dut"],
+                    dev=values["dev"],
+                    # Curves of a family are each at the gate voltage of their step
+                    vge=values["vge"] if step is None else step,
+                    temperature=values["temperature"],
+                    vce_percentage=values["vce_percentage"],
+                    path=path,
+                    position=position,
+                    offset=record["offset"],
+                    nr_pt=record["nr_pt"],
+                    curve_index=record["index"],
+                    step=step,
+                    timestamp=record["timestamp"],
+                    crc32=record["crc32"],
+                ))
+
+        with self._conn:
+            self._conn.execute(
+                "INSERT INTO runs (path, dut, dev, vge, temperature, vce_percentage, registered, metadata) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?) ON CONFLICT (path) DO UPDATE SET dut = excluded.dut, "
+                "dev = excluded.dev, vge = excluded.vge, temperature = excluded.temperature, "
+                "vce_percentage = excluded.vce_percentage, registered = excluded.registered, "
+                "metadata = excluded.metadata",
+                (path, *(values[name] for name in PARAMETERS), time.time(), json.dumps(metadata)))
+            run_id = self._conn.execute("SELECT id FROM runs WHERE path = ?", (path,)).fetchone()[0]
+            self._conn.execute("DELETE FROM entries WHERE run_id = ? AND kind = 'curve'", (run_id,))
+            self._insert(run_id, rows)
+        logger.info(f"{len(rows)} curves of {path} registered in {self.filename}")
+        return len(rows)
+
+    def register_file(self, run_file: str, path: str, kind: str = "mean", vge: float = None) -> None:
+        """
+        Register a file derived from a registered run, e.g. its mean or statistics file.
+
+        Args:
+            run_file (str): Path of the run file the file was computed from.
+            path (str): Path of the file.
+            kind (str): "mean" or "stats".
+            vge (float): Gate voltage, for the per-step files of a family. Defaults to the one of the run.
+
+        Raises:
+            ValueError: If the run file is not registered.
+        """
+        row = self._conn.execute("SELECT id, dut, dev, vge, temperature, vce_percentage FROM runs WHERE path = ?",
+                                 (os.path.abspath(run_file),)).fetchone()
+        if row is None:
+            raise ValueError(f"Run file {run_file} is not registered in {self.filename}.")
+        run_id, dut, dev, run_vge, temperature, vce_percentage = row
+        path = os.path.abspath(path)
+        entry = CatalogEntry(kind=kind, dut=dut, dev=dev, vge=run_vge if vge is None else _number(vge),
+                             temperature=temperature, vce_percentage=vce_percentage, path=path,
+                             timestamp=os.path.getmtime(path), crc32=_file_crc32(path))
+        with self._conn:
+            self._conn.execute("DELETE FROM entries WHERE run_id = ? AND path = ?", (run_id, path))
+            self._insert(run_id, [entry])
+
+    def _insert(self, run_id: int, entries: list) -> None:
+        fields = list(CatalogEntry.__dataclass_fields__)
+        self._conn.executemany(
+            f"INSERT INTO entries (run_id, {_ENTRY_COLUMNS}) VALUES (?{', ?' * len(fields)})",
+            [(run_id, *(getattr(entry, name) for name in fields)) for entry in entries])
+
+    def find(self, kind: str = "curve", **parameters) -> list:
+        """
+        Registered entries matching all the given parameters.
+
+        Args:
+            kind (str): "curve", "mean" or "stats"; None for all of them.
+            parameters: dut, dev, vge, temperature, vce_percentage or step. A value matches exactly,
+                a (low, high) tuple matches the inclusive range.
+
+        Returns:
+            list: CatalogEntry objects, ordered by path and position.
+
+        Raises:
+            ValueError: If a parameter is unknown.
+        """
+        conditions = []
+        arguments = []
+        if kind is not None:
+            parameters["kind"] = kind
+        for name, value in parameters.items():
+            if name not in PARAMETERS and name not in ("kind", "step"):
+                raise ValueError(f"Unknown catalog parameter '{name}', expected one of {sorted(PARAMETERS + ('step',))}.")
+            if value is None:
+                continue
+            if isinstance(value, tuple):
+                conditions.append(f"{name} BETWEEN ? AND ?")
+                arguments.extend(value)
+            else:
+                conditions.append(f"{name} = ?")
+                arguments.append(value)
+        where = f" WHERE {' AND '.join(conditions)}" if conditions else ""
+        cursor = self._conn.execute(f"SELECT {_ENTRY_COLUMNS} FROM entries{where} ORDER BY path, position", arguments)
+        return [CatalogEntry(*row) for row in cursor]
+
+    def load_curves(self, entries: list, verify: bool = False) -> list:
+        """
+        Read the curves of catalog entries, opening each run file once.
+
+        Args:
+            entries (list): CatalogEntry objects of kind "curve", e.g. from find().
+            verify (bool): Check the CRC-32 of the codes of every curve against the catalog.
+
+        Returns:
+            list: Curve objects, in the order of entries.
+
+        Raises:
+            ValueError: If an entry is not a curve, or a checksum does not match.
+        """
+        # The curves view the memory maps of their run files, so the readers are released with the curves
+        readers = {}
+        curves = []
+        for entry in entries:
+            if entry.kind != "curve":
+                raise ValueError(f"{entry.path} is a {entry.kind} file, not a curve.")
+            run = readers.get(entry.path)
+            if run is None:
+                run = readers[entry.path] = RunReader(entry.path)
+            if verify and zlib.crc32(run.codes(entry.position).tobytes()) != entry.crc32:
+                raise ValueError(f"Curve {entry.position} of {entry.path} does not match its catalog checksum.")
+            curves.append(run.curve(entry.position))
+        return curves
+
+    def close(self) -> None:
+        self._conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description="Register run files in the measurement catalog, or query it.")
+    parser.add_argument("--catalog", default=DEFAULT_PATH, help="Catalog database")
+    commands = parser.add_subparsers(dest="command", required=True)
+    register = commands.add_parser("register", help="Register the curves of run files")
+    register.add_argument("run_files", nargs="+")
+    find = commands.add_parser("find", help="List the matching curves or files")
+    find.add_argument("--kind", default="curve", help="curve, mean or stats")
+    find.add_argument("--dut")
+    find.add_argument("--dev")
+    find.add_argument("--vge", type=float)
+    find.add_argument("--temperature", type=float)
+    find.add_argument("--vce-percentage", type=float)
+    args = parser.parse_args(argv)
+
+    with Catalog(args.catalog) as catalog:
+        if args.command == "register":
+            for run_file in args.run_files:
+                print(f"{catalog.register_run(run_file)} curves registered from {run_file}")
+        else:
+            entries = catalog.find(args.kind, dut=args.dut, dev=args.dev, vge=args.vge,
+                                   temperature=args.temperature, vce_percentage=args.vce_percentage)
+            for entry in entries:
+                location = "" if entry.position is None else f" #{entry.position} @ {entry.offset}"
+                print(f"{entry.path}{location}  {entry.dut} {entry.dev} Vge={entry.vge} V "
+                      f"T={entry.temperature} C VCE={entry.vce_percentage} %")
+            print(f"{len(entries)} entries")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,294 @@
+"""
+container.py
+Single-file binary container for all the curves of a run (.t371).
+
+The raw 10-bit X/Y codes of every curve are appended as they are acquired, together with
+their preamble, settings snapshot and timestamp. An index at the end of the file gives the
+offset of every curve, so any of them is read straight from a memory map with no parsing.
+
+Layout (all integers little-endian):
+    File header   b"T371RUN\\0", uint32 version, uint32 metadata length, run metadata (JSON)
+    Record        b"CURV", uint32 index, uint32 NR.PT, float64 timestamp, uint32 metadata length,
+                  uint32 CRC-32 of the codes, 8 bytes reserved, curve metadata (JSON, padded
+                  to 8 bytes), NR.PT x 2 uint16 codes
+    ...
+    Index         uint64 offset of every record, b"T371IDX\\0", uint64 number of records
+
+The index is written by close(). A file whose writer did not close (e.g. after a crash) is
+still readable: the records are found by walking their headers, and an incomplete last
+record is ignored.
+
+Example:
+    with RunWriter(f"{folder}/{file}.t371", metadata={"DUT": DUT}) as run:
+        run.append(curve, index=1)
+
+    run = RunReader(f"{folder}/{file}.t371")
+    codes = run.codes(0)  # Memory-mapped, no copy
+    curve = run.curve(0)
+"""
+import json
+import os
+import struct
+import zlib
+
+import numpy as np
+
+from .curve import Curve
+from .preamble import parse_preamble
+
+import logging
+logger = logging.getLogger(__name__)
+
+EXTENSION = ".t371"
+VERSION = 1
+
+_FILE_MAGIC = b"T371RUN\0"
+_FILE_HEADER = struct.Struct("<8sII")
+_RECORD_MAGIC = b"CURV"
+_RECORD_HEADER = struct.Struct("<4sIIdII8x")
+_INDEX_MAGIC = b"T371IDX\0"
+_INDEX_TRAILER = struct.Struct("<8sQ")
+_CODES_DTYPE = np.dtype("<u2")
+
+
+def _padded(length: int) -> int:
+    return (length + 7) & ~7
+
+
+def _encode(metadata: dict) -> bytes:
+    data = json.dumps(metadata, separators=(",", ":")).encode("utf-8")
+    return data.ljust(_padded(len(data)), b" ")
+
+
+def _scan(f, start: int, size: int) -> list:
+    """Offsets of the complete records from start, walking their headers."""
+    offsets = []
+    offset = start
+    while offset + _RECORD_HEADER.size <= size:
+        f.seek(offset)
+        magic, _, nr_pt, _, meta_len, _ = _RECORD_HEADER.unpack(f.read(_RECORD_HEADER.size))
+        if magic != _RECORD_MAGIC:
+            break
+        end = offset + _RECORD_HEADER.size + _padded(meta_len) + nr_pt * 2 * _CODES_DTYPE.itemsize
+        if end > size:
+            logger.warning("Ignoring incomplete record at offset %s", offset)
+            break
+        offsets.append(offset)
+        offset = end
+    return offsets
+
+
+def _read_layout(f) -> tuple:
+    """
+    Read the file header and the record offsets.
+
+    Returns:
+        tuple: (run metadata, end of the header, record offsets, end of the last record)
+    """
+    f.seek(0, os.SEEK_END)
+    size = f.tell()
+    f.seek(0)
+    magic, version, meta_len = _FILE_HEADER.unpack(f.read(_FILE_HEADER.size))
+    if magic != _FILE_MAGIC:
+        raise ValueError("Not a TEK371 run file.")
+    if version > VERSION:
+        raise ValueError(f"Run file version {version} is newer than the supported {VERSION}.")
+    metadata = json.loads(f.read(meta_len))
+    data_start = _FILE_HEADER.size + _padded(meta_len)
+
+    # Index written by close()
+    if size >= data_start + _INDEX_TRAILER.size:
+        f.seek(size - _INDEX_TRAILER.size)
+        magic, count = _INDEX_TRAILER.unpack(f.read(_INDEX_TRAILER.size))
+        index_start = size - _INDEX_TRAILER.size - 8 * count
+        if magic == _INDEX_MAGIC and index_start >= data_start:
+            f.seek(index_start)
+            offsets = np.frombuffer(f.read(8 * count), dtype="<u8").tolist()
+            return metadata, data_start, offsets, index_start
+
+    offsets = _scan(f, data_start, size)
+    if offsets:
+        f.seek(offsets[-1])
+        _, _, nr_pt, _, meta_len, _ = _RECORD_HEADER.unpack(f.read(_RECORD_HEADER.size))
+        end = offsets[-1] + _RECORD_HEADER.size + _padded(meta_len) + nr_pt * 2 * _CODES_DTYPE.itemsize
+    else:
+        end = data_start
+    return metadata, data_start, offsets, end
+
+
+class RunWriter:
+    """
+    Appends curves to a run file while the acquisition runs.
+
+    Args:
+        filename (str): Path of the run file, usually ending in .t371.
+        metadata (dict): JSON-serializable description of the run (DUT, conditions...),
+            only used when the file is created.
+        append (bool): Keep the curves of an existing file and add new ones after them.
+            Otherwise an existing file is overwritten.
+    """
+
+    def __init__(self, filename: str, metadata: dict = None, append: bool = False):
+        self.filename = filename
+        if append and os.path.exists(filename):
+            self._file = open(filename, "r+b")
+            self.metadata, _, self._offsets, end = _read_layout(self._file)
+            # Drop the old index, it is written again by close()
+            self._file.truncate(end)
+            self._file.seek(end)
+        else:
+            self.metadata = dict(metadata or {})
+            self._file = open(filename, "wb")
+            meta = _encode(self.metadata)
+            self._file.write(_FILE_HEADER.pack(_FILE_MAGIC, VERSION, len(meta)) + meta)
+            self._offsets = []
+
+    def __len__(self) -> int:
+        return len(self._offsets)
+
+    def append(self, curve: Curve, index: int = None, settings: dict = None, **extra) -> int:
+        """
+        Append a curve. The record is flushed to the operating system, so readers (and the file
+        left by a crash) have every curve appended so far.
+
+        Args:
+            curve (Curve): The curve; its raw codes, preamble, timestamp and step are stored.
+            index (int): Curve number within the run. Defaults to the number of curves so far + 1.
+            settings (dict): Settings snapshot (e.g. Tek371.settings_snapshot()).
+            extra: Any other JSON-serializable values to keep with the curve.
+
+        Returns:
+            int: Position of the curve in the file, for RunReader.
+        """
+        codes = np.ascontiguousarray(curve.codes, dtype=_CODES_DTYPE)
+        index = len(self._offsets) + 1 if index is None else index
+        meta = dict(extra, preamble=curve.preamble.raw, step=curve.step)
+        if settings is not None:
+            meta["settings"] = settings
+        meta = _encode(meta)
+        data = codes.tobytes()
+
+        offset = self._file.tell()
+        self._file.write(_RECORD_HEADER.pack(_RECORD_MAGIC, index, len(codes), curve.timestamp, len(meta),
+                                             zlib.crc32(data)))
+        self._file.write(meta)
+        self._file.write(data)
+        self._file.flush()
+        self._offsets.append(offset)
+        return len(self._offsets) - 1
+
+    def flush(self) -> None:
+        """Push the appended curves to the operating system, so readers see them."""
+        self._file.flush()
+
+    def close(self) -> None:
+        """Write the index and close the file."""
+        if self._file.closed:
+            return
+        offsets = np.asarray(self._offsets, dtype="<u8")
+        self._file.write(offsets.tobytes() + _INDEX_TRAILER.pack(_INDEX_MAGIC, len(offsets)))
+        self._file.close()
+        logger.info(f"{len(offsets)} curves saved to {self.filename}")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+class RunReader:
+    """
+    Random access to the curves of a run file through a read-only memory map.
+
+    Args:
+        filename (str): Path of the run file.
+    """
+
+    def __init__(self, filename: str):
+        self.filename = filename
+        with open(filename, "rb") as f:
+            self.metadata, _, offsets, _ = _read_layout(f)
+        self._map = np.memmap(filename, dtype=np.uint8, mode="r")
+        # Parse every record header once, so curves are then located with no I/O
+        self._records = []
+        for offset in offsets:
+            header = bytes(self._map[offset:offset + _RECORD_HEADER.size])
+            _, index, nr_pt, timestamp, meta_len, crc = _RECORD_HEADER.unpack(header)
+            data_start = offset + _RECORD_HEADER.size + _padded(meta_len)
+            self._records.append((index, nr_pt, timestamp, offset + _RECORD_HEADER.size, meta_len, data_start, crc))
+
+    def __len__(self) -> int:
+        return len(self._records)
+
+    def __getitem__(self, position: int) -> Curve:
+        return self.curve(position)
+
+    def __iter__(self):
+        return (self.curve(position) for position in range(len(self)))
+
+    @property
+    def indices(self) -> list:
+        """Curve number of every record, in file order."""
+        return [record[0] for record in self._records]
+
+    @property
+    def timestamps(self) -> np.ndarray:
+        return np.array([record[2] for record in self._records])
+
+    def record(self, position: int) -> dict:
+        """
+        Location and checksum of a curve: its index, NR.PT, timestamp, byte offset of its codes
+        in the file and CRC-32 of the codes.
+        """
+        index, nr_pt, timestamp, _, _, data_start, crc = self._records[position]
+        return {"index": index, "nr_pt": nr_pt, "timestamp": timestamp, "offset": data_start, "crc32": crc}
+
+    def codes(self, position: int) -> np.ndarray:
+        """
+        Raw X/Y codes of a curve, as a read-only view of the memory map (no copy, no parsing).
+
+        Returns:
+            numpy.ndarray: uint16 array of shape (NR.PT, 2).
+        """
+        _, nr_pt, _, _, _, data_start, _ = self._records[position]
+        return self._map[data_start:data_start + nr_pt * 4].view(_CODES_DTYPE).reshape(nr_pt, 2)
+
+    def curve_metadata(self, position: int) -> dict:
+        """Preamble, step, settings snapshot and extra values stored with a curve."""
+        _, _, _, meta_start, meta_len, _, _ = self._records[position]
+        return json.loads(bytes(self._map[meta_start:meta_start + meta_len]))
+
+    def curve(self, position: int) -> Curve:
+        """Curve at a position in the file, scaled and sorted as when it was acquired."""
+        index, _, timestamp, _, _, _, _ = self._records[position]
+        meta = self.curve_metadata(position)
+        return Curve.from_codes(self.codes(position), parse_preamble(meta["preamble"]), timestamp, meta.get("step"))
+
+    def verify(self, position: int) -> bool:
+        """Check the stored CRC-32 of the codes of a curve."""
+        return zlib.crc32(self.codes(position).tobytes()) == self._records[position][6]
+
+    def points(self) -> np.ndarray:
+        """
+        Scaled points of every curve, sorted by ascending current.
+
+        Returns:
+            numpy.ndarray: Array of shape (N, points, 2).
+
+        Raises:
+            ValueError: If the curves do not all have the same number of points.
+        """
+        if len({record[1] for record in self._records}) > 1:
+            raise ValueError("Curves of the run have different numbers of points.")
+        return np.stack([self.curve(position).points for position in range(len(self))])
+
+    def close(self) -> None:
+        """Release the memory map. It is unmapped once the codes and curves read from it are gone too."""
+        self._map = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
@@ -0,0 +1,290 @@
+"""
+curve.py
+Decoding of TEK371 CURVE binary blocks into scaled voltage/current points.
+"""
+import time
+
+import numpy as np
+
+from .preamble import Preamble, parse_preamble
+
+import logging
+logger = logging.getLogger(__name__)
+
+# ---- From the TEK371 manual ----
+CURVE_HEAD_LEN = 25
+BYTES_FOR_DATA_LEN = 2
+BYTES_FOR_CHECKSUM = 1
+BYTES_PER_X = 2
+BYTES_PER_Y = 2
+# ---- From the TEK371 manual ----
+
+
+def curve_length(nr_pt: int) -> int:
+    """
+    Number of bytes the 371 sends in response to CUR? for a curve of nr_pt points.
+    """
+    points_to_read = nr_pt * (BYTES_PER_X + BYTES_PER_Y)
+    return CURVE_HEAD_LEN + BYTES_FOR_DATA_LEN + points_to_read + BYTES_FOR_CHECKSUM
+
+
+class ChecksumError(ValueError):
+    """Raised when a CURVE block does not match its checksum byte."""
+
+
+def verify_checksum(raw: bytes) -> bool:
+    """
+    Check the CURVE block checksum.
+
+    The last byte is the two's complement of the modulo-256 sum of the preceding binary
+    data (count and points), so the sum of all of them including the checksum must be 0 modulo 256.
+
+    Args:
+        raw (bytes): Full response to CUR? (header, count, points and checksum).
+
+    Returns:
+        bool: True if the block is complete and the checksum matches.
+    """
+    if len(raw) < CURVE_HEAD_LEN + BYTES_FOR_DATA_LEN + BYTES_FOR_CHECKSUM:
+        return False
+    data = np.frombuffer(raw, dtype=np.uint8, offset=CURVE_HEAD_LEN)
+    return int(data.sum(dtype=np.uint64)) % 256 == 0
+
+
+def decode_codes(raw: bytes, nr_pt: int) -> np.ndarray:
+    """
+    Extract the raw 10-bit X/Y codes from a CURVE block, in the order sent by the 371.
+
+    Args:
+        raw (bytes): Full response to CUR? (header, count, points and checksum).
+        nr_pt (int): Number of points announced by the preamble (NR.PT).
+
+    Returns:
+        numpy.ndarray: uint16 array of shape (NR.PT, 2) with X codes in column 0 and Y codes in column 1.
+
+    Raises:
+        ValueError: If the number of points in raw does not match NR.PT.
+    """
+    # Just extract waveform data, without header nor checksum
+    start_idx = CURVE_HEAD_LEN + BYTES_FOR_DATA_LEN
+    end_idx = len(raw) - BYTES_FOR_CHECKSUM
+    n_points = max(end_idx - start_idx, 0) // (BYTES_PER_X + BYTES_PER_Y)
+
+    # Check if we received the whole measured waveform
+    if n_points != nr_pt:
+        logger.error("Parsed points mismatch: got %s, expected %s", n_points, nr_pt)
+        raise ValueError(f"Number of points parsed ({n_points}) does not match expected ({nr_pt}).")
+
+    # Data is arranged in pairs of 4 bytes, 2 for X and 2 for Y
+    codes = np.frombuffer(raw, dtype=">u2", count=2 * n_points, offset=start_idx).reshape(n_points, 2)
+    return codes.astype(np.uint16)
+
+
+def scale_codes(codes: np.ndarray, preamble: Preamble, sort: bool = True) -> np.ndarray:
+    """
+    Apply XOFF/YOFF/XMULT/YMULT to raw X/Y codes.
+
+    Args:
+        codes (numpy.ndarray): Array of shape (n, 2) as returned by decode_codes.
+        preamble (Preamble): Parsed preamble.
+        sort (bool): If True, reorder the points by ascending current.
+
+    Returns:
+        numpy.ndarray: Array of shape (n, 2) with voltage (V) in column 0 and current (A) in column 1.
+    """
+    offset = np.array([preamble.xoff, preamble.yoff], dtype=np.float64)
+    gain = np.array([preamble.xmult, preamble.ymult], dtype=np.float64)
+    points = (codes.astype(np.float64) - offset) * gain
+
+    if sort:
+        # Due to how the 371 measures, it returns first the higher current values. To simplify post-processing
+        # we simply reorder it to ascending current
+        points = points[np.argsort(points[:, 1], kind="stable")]
+    return points
+
+
+def decode_curve(raw: bytes, preamble, sort: bool = True) -> np.ndarray:
+    """
+    Decode a CURVE block into scaled (voltage, current) points.
+
+    The point data is viewed as big-endian uint16 X/Y code pairs and scaled as whole
+    arrays with XOFF/YOFF/XMULT/YMULT, so no per-point Python work is done.
+
+    Args:
+        raw (bytes): Full response to CUR? (header, count, points and checksum).
+        preamble (str | Preamble): WFMPRE response string, or its parsed Preamble.
+        sort (bool): If True, reorder the points by ascending current. The 371 returns
+            the higher current values first, so this simplifies post-processing.
+
+    Returns:
+        numpy.ndarray: Array of shape (NR.PT, 2) with voltage (V) in column 0 and current (A) in column 1.
+
+    Raises:
+        ValueError: If the number of points in raw does not match NR.PT.
+    """
+    if isinstance(preamble, str):
+        preamble = parse_preamble(preamble)
+    return scale_codes(decode_codes(raw, preamble.nr_pt), preamble, sort=sort)
+
+
+def family_starts(codes: np.ndarray, n_curves: int) -> np.ndarray:
+    """
+    Positions of the first point of every curve of a step generator family but the first.
+
+    The curves of a family are sent one after the other, in step order, and each one is a sweep
+    of the collector supply from its peak down to zero (the higher currents come first). The
+    preamble only gives the NR.PT of the whole family, so a curve is recognized from the data:
+    it starts where the X (collector voltage) code rises back from the end of the previous
+    sweep, and the n_curves - 1 largest rises of X are taken as the boundaries. The curves need
+    not have the same number of points.
+
+    Args:
+        codes (numpy.ndarray): Raw X/Y codes of the whole family, of shape (NR.PT, 2), as sent by the 371.
+        n_curves (int): Number of curves, i.e. number of steps + 1.
+
+    Returns:
+        numpy.ndarray: Ascending indices into codes, of length n_curves - 1.
+
+    Raises:
+        ValueError: If there are fewer points than curves, or X does not restart n_curves - 1 times.
+    """
+    if not 1 <= n_curves <= len(codes):
+        raise ValueError(f"Cannot split {len(codes)} points into {n_curves} curves.")
+    if n_curves == 1:
+        return np.empty(0, dtype=np.intp)
+    x = codes[:, 0].astype(np.int32)
+    rises = np.diff(x)
+    starts = np.sort(np.argpartition(rises, len(rises) - n_curves + 1)[len(rises) - n_curves + 1:]) + 1
+    # A restart goes back up most of the sweep, noise within a sweep is a few codes
+    if rises[starts - 1].min() <= (x.max() - x.min()) // 4:
+        raise ValueError(f"Cannot find the {n_curves} sweeps of the family: the collector voltage restarts "
+                         f"fewer than {n_curves - 1} times.")
+    return starts
+
+
+def decode_family(raw: bytes, preamble, n_curves: int, timestamp: float = None) -> list:
+    """
+    Decode a CURVE block holding a step generator family into one Curve per step.
+
+    The codes are split into views where each sweep of the collector supply starts (see
+    family_starts); each curve is scaled and ordered by ascending current the first time
+    its points are used.
+
+    Args:
+        raw (bytes): Full response to CUR? (header, count, points and checksum).
+        preamble (str | Preamble): WFMPRE response string, or its parsed Preamble.
+        n_curves (int): Number of curves in the family, i.e. number of steps + 1.
+        timestamp (float): Acquisition time. Defaults to now.
+
+    Returns:
+        list: Curve objects in step order, each tagged with its step value
+        OFFSET + k * STEP (None if the preamble does not report them).
+
+    Raises:
+        ValueError: If the number of points in raw does not match NR.PT, or cannot be split in n_curves.
+    """
+    if isinstance(preamble, str):
+        preamble = parse_preamble(preamble)
+    timestamp = time.time() if timestamp is None else timestamp
+    codes = decode_codes(raw, preamble.nr_pt)
+
+    starts = family_starts(codes, n_curves)
+    if preamble.step is None:
+        steps = [None] * n_curves
+    else:
+        steps = ((preamble.offset or 0.0) + np.arange(n_curves) * preamble.step).tolist()
+    return [Curve(c, preamble, timestamp, step) for c, step in zip(np.split(codes, starts), steps)]
+
+
+class Curve:
+    """
+    In-memory result of a single curve acquisition.
+
+    Only the raw codes and the preamble are kept, so the instrument output is preserved
+    bit for bit; voltage and current are scaled from them the first time they are used.
+
+    Attributes:
+        codes (numpy.ndarray): Raw uint16 X/Y codes of shape (n, 2), in the order sent by the 371.
+        preamble (Preamble): Parsed preamble used to scale the codes.
+        timestamp (float): Acquisition time, in seconds since the epoch.
+        step (float): Step generator value of this curve in V or A, for curves of a family; None otherwise.
+        voltage (numpy.ndarray): Voltage of every point in V, sorted by ascending current.
+        current (numpy.ndarray): Current of every point in A, sorted by ascending current.
+    """
+
+    __slots__ = ("codes", "preamble", "timestamp", "step", "_points")
+
+    def __init__(self, codes: np.ndarray, preamble: Preamble, timestamp: float, step: float = None):
+        self.codes = codes
+        self.preamble = preamble
+        self.timestamp = timestamp
+        self.step = step
+        self._points = None
+
+    @classmethod
+    def from_raw(cls, raw: bytes, preamble, timestamp: float = None) -> "Curve":
+        """
+        Build a Curve from a CUR? response and its preamble.
+
+        Args:
+            raw (bytes): Full response to CUR?.
+            preamble (str | Preamble): WFMPRE response string, or its parsed Preamble.
+            timestamp (float): Acquisition time. Defaults to now.
+        """
+        if isinstance(preamble, str):
+            preamble = parse_preamble(preamble)
+        return cls.from_codes(decode_codes(raw, preamble.nr_pt), preamble, timestamp)
+
+    @classmethod
+    def from_codes(cls, codes: np.ndarray, preamble, timestamp: float = None, step: float = None) -> "Curve":
+        """
+        Build a Curve from raw X/Y codes (e.g. read back from a run file) and their preamble.
+
+        Args:
+            codes (numpy.ndarray): uint16 array of shape (n, 2), in the order sent by the 371.
+            preamble (str | Preamble): WFMPRE response string, or its parsed Preamble.
+            timestamp (float): Acquisition time. Defaults to now.
+            step (float): Step generator value, for curves of a family.
+        """
+        if isinstance(preamble, str):
+            preamble = parse_preamble(preamble)
+        return cls(codes, preamble, time.time() if timestamp is None else timestamp, step)
+
+    @classmethod
+    def load(cls, filename: str) -> "Curve":
+        """
+        Read a curve saved by the "raw" or "binary" sink (.npz).
+
+        Args:
+            filename (str): Path to the file.
+        """
+        with np.load(filename) as data:
+            step = float(data["step"])
+            preamble = data["preamble"]
+            # The raw sink keeps the preamble as ASCII bytes, the binary sink as a string
+            preamble = preamble.tobytes().decode("ascii") if preamble.dtype == np.uint8 else str(preamble)
+            return cls.from_codes(data["codes"], preamble, float(data["timestamp"]), None if np.isnan(step) else step)
+
+    @property
+    def points(self) -> np.ndarray:
+        """(voltage, current) pairs as a read-only array of shape (n, 2), scaled on first use."""
+        if self._points is None:
+            points = scale_codes(self.codes, self.preamble)
+            points.flags.writeable = False
+            self._points = points
+        return self._points
+
+    @property
+    def voltage(self) -> np.ndarray:
+        return self.points[:, 0]
+
+    @property
+    def current(self) -> np.ndarray:
+        return self.points[:, 1]
+
+    def __len__(self) -> int:
+        return len(self.codes)
+
+    def __repr__(self) -> str:
+        step = "" if self.step is None else f", step={self.step:g}"
+        return f"Curve(points={len(self)}{step}, timestamp={self.timestamp:.3f})"
@@ -3,42 +3,339 @@ from pyvisa.constants import (
     VI_EVENT_SERVICE_REQ,
     EventMechanism,
     VI_ALL_ENABLED_EVENTS,
+    VI_ERROR_TMO,
 )
 from . import commands as cmd
+from .curve import Curve, ChecksumError, curve_length, decode_family, verify_checksum
+from .preamble import Preamble, parse_preamble
+from .sinks import CsvSink
+from .metrics import Metrics, command_header
+from .timeouts import AdaptiveTimeout
+from .session import get_pool
+import re
 import time
 import threading
-import csv
+from contextlib import contextmanager
 
 
 import logging
 logger = logging.getLogger(__name__)
 
+# Shadow-state key of every setting written through _write_setting, and the query that reads it back
+_SETTING_QUERIES = {
+    "CSP": cmd.CSP_QUERY,
+    "PKP": cmd.PKP_QUERY,
+    "VCS": cmd.VCS_QUERY,
+    "DIS MODE": cmd.DIS_QUERY,
+    "DIS INV": cmd.DIS_QUERY,
+    "DIS CAL": cmd.DIS_QUERY,
+    "HOR": cmd.HOR_QUERY,
+    "VER": cmd.VER_QUERY,
+    "STP OUT": cmd.STP_QUERY,
+    "STP SIZE": cmd.STP_QUERY,  # STP CUR and STP VOL replace each other
+    "STP NUM": cmd.STP_QUERY,
+    "STP INV": cmd.STP_QUERY,
+    "STP MUL": cmd.STP_QUERY,
+    "STP OFF MODE": cmd.STP_QUERY,
+    "STP OFF": cmd.STP_QUERY,
+    "OPC": cmd.OPC_QUERY,
+    "RQS": cmd.RQS_QUERY,
+    "DEB": cmd.DEB_QUERY,
+}
+
+# Settings XMULT/YMULT/XOFF/YOFF, NR.PT and the STEP/OFFSET readout of the preamble depend on
+_SCALE_SETTINGS = ("CSP", "PKP", "HOR", "VER", "STP NUM", "STP SIZE", "STP MUL", "STP OFF")
+
+# SET? response headers, and the query answering with the same field (None if not shadowed)
+_SET_HEADERS = {
+    "OPC": cmd.OPC_QUERY,
+    "RQS": cmd.RQS_QUERY,
+    "PKPOWER": cmd.PKP_QUERY,
+    "CSPOL": cmd.CSP_QUERY,
+    "HORIZ": cmd.HOR_QUERY,
+    "VERT": cmd.VER_QUERY,
+    "STEPGEN": cmd.STP_QUERY,
+    "VCSPPLY": cmd.VCS_QUERY,
+    "DISPLAY": cmd.DIS_QUERY,
+    "MEASURE": None,  # Changes by itself when a single or sweep measurement ends
+    "CURSOR": None,
+}
+
 class Tek371:
     """Driver class for Tektronix 371 Curve Tracer using PyVISA."""
 
-    def __init__(self, resource: str, timeout_ms: int = 5000):
-        self.rm = pyvisa.ResourceManager()
-        self.inst = self.rm.open_resource(resource)
+    # Longest semicolon-joined message sent by batch(), kept within the 371 GPIB input buffer
+    MAX_MESSAGE_LENGTH = 256
+
+
+    def __init__(self, resource, timeout_ms: int = 5000, max_curve_retries: int = 3,
+                 coalesce_writes: bool = True, metrics=False, metrics_file: str = None,
+                 adaptive_timeouts: bool = False, pool=None):
+        """
+        Args:
+            resource (str | object): VISA resource address (e.g. "GPIB0::23::INSTR"), or an already
+                open resource object such as tek371.sim.SimulatedTek371Resource.
+            timeout_ms (int): VISA I/O timeout, or the initial one with adaptive_timeouts.
+            max_curve_retries (int): Times CUR? is re-issued after a checksum mismatch.
+            coalesce_writes (bool): Skip setting writes that would not change anything.
+            metrics (bool | Metrics): Time every I/O call and count bytes, retries and SRQ waits
+                (see metrics.py). Pass a Metrics object to share it between instruments.
+            metrics_file (str): If given with metrics, the metrics are written there as JSON on close().
+            adaptive_timeouts (bool): Size the timeout of the binary curve reads from their number of bytes
+                and the measured bus latency and throughput (see timeouts.py). Commands and text queries
+                keep timeout_ms, which also covers the processing time of slow ones such as INI or TES?.
+            pool (SessionPool): Pool the session to an address is taken from. Defaults to the
+                process-wide one, so the ResourceManager and the session are shared and reused.
+        """
+        if isinstance(resource, str):
+            self._pool = get_pool() if pool is None else pool
+            self.rm = self._pool.resource_manager
+            self.inst = self._pool.open_resource(resource)
+        else:
+            self._pool = None
+            self.rm = None
+            self.inst = resource
         self.inst.timeout = timeout_ms
+        self._timeout_ms = timeout_ms  # Timeout currently set on the VISA session
         self.inst.write_termination = '\n'
         self.inst.read_termination = '\n'
 
         # --- SRQ state ---
-        self._srq_called = False
-        self._srq_lock = threading.Lock()
+        self._srq_event = threading.Event()  # Set by the SRQ handler
+        self._srq_time = None  # perf_counter() when the SRQ handler last ran
+        self._srq_handler = None  # Wrapped handler, installed once per session
+        self._srq_user_handle = None
         self._srq_handler_installed = False
+        self._srq_enabled = False  # VISA SRQ delivery enabled
+        self.last_srq_wait_s = None  # Time spent in the last wait_for_srq
+        self.last_srq_latency_s = None  # Delay between the SRQ handler and wait_for_srq returning
+
+        # --- Shadow state ---
+        # Last command written for every setting, and the last response read back for every query,
+        # so writes that change nothing and queries whose answer is known are not sent again.
+        self.coalesce_writes = coalesce_writes
+        self._written = {}
+        self._readback = {}
+
+        # --- Preamble cache ---
+        # XMULT/YMULT/XOFF/YOFF and NR.PT only change with the scale settings, so the parsed
+        # preamble is reused until one of them is written again.
+        self._preamble_cache = None
+
+        # --- Batched writes ---
+        self._batch = None  # Commands waiting to be sent while inside batch()
+
+        # --- Curve transfer ---
+        self.max_curve_retries = max_curve_retries
+        self.curve_retries = 0  # Total CUR? re-issued because of a checksum mismatch
+
+        # --- Instrumentation ---
+        # None when disabled, so the I/O hot path only pays for one attribute check
+        self._metrics = metrics if isinstance(metrics, Metrics) else (Metrics() if metrics else None)
+        self.metrics_file = metrics_file
+        self._last_query = ""  # Header the next read is accounted under
+
+        # --- Adaptive timeouts ---
+        self._timeouts = AdaptiveTimeout(timeout_ms) if adaptive_timeouts else None
 
     # -----------------------
     # Low-level I/O
     # -----------------------
     def write(self, command: str) -> None:
-        self.inst.write(command)
+        if self._batch is not None:
+            self._batch.append(command)
+            return
+        self._send(command)
 
     def query(self, command: str) -> str:
-        return self.inst.query(command)
+        self._flush_batch()
+        if self._metrics is None and self._timeouts is None:
+            return self.inst.query(command)
+        header = command_header(command)
+        response = self._timed_io(self.inst.query, "query", header, None, len(command) + 1, command)
+        self._last_query = header
+        return response
+
+    def read(self) -> str:
+        self._flush_batch()
+        if self._metrics is None and self._timeouts is None:
+            return self.inst.read()
+        return self._timed_io(self.inst.read, "read", self._last_query, None)
+
+    def read_bytes(self, count: int) -> bytes:
+        self._flush_batch()
+        if self._metrics is None and self._timeouts is None:
+            return self.inst.read_bytes(count)
+        return self._timed_io(self.inst.read_bytes, "read", self._last_query, count, 0, count)
 
     def read_raw(self) -> bytes:
-        return self.inst.read_raw()
+        self._flush_batch()
+        if self._metrics is None and self._timeouts is None:
+            return self.inst.read_raw()
+        return self._timed_io(self.inst.read_raw, "read", self._last_query, None)
+
+    def _send(self, message: str) -> None:
+        """Write a message to the instrument right away, bypassing batch()."""
+        if self._timeouts is not None:
+            # The 371 may hold off a command while it processes the previous one, keep the fixed timeout
+            self._set_timeout(self._timeouts.timeout_ms())
+        if self._metrics is None:
+            self.inst.write(message)
+            return
+        header = command_header(message)
+        start = time.perf_counter()
+        self.inst.write(message)
+        self._metrics.record("write", header, time.perf_counter() - start, bytes_out=len(message) + 1)
+        if header.endswith("?"):
+            self._last_query = header
+
+    def _timed_io(self, io, op: str, header: str, expected_bytes, bytes_out: int = 0, *args):
+        """
+        Run a read or query with a timeout sized for expected_bytes (None for the fixed timeout,
+        e.g. text responses), and feed its duration to the adaptive timeouts and the metrics.
+        """
+        if self._timeouts is not None:
+            self._set_timeout(self._timeouts.timeout_ms(expected_bytes))
+        start = time.perf_counter()
+        try:
+            data = io(*args)
+        except pyvisa.errors.VisaIOError as e:
+            if self._timeouts is not None and e.error_code == VI_ERROR_TMO:
+                # Maybe the estimate was too optimistic, start over from the default timeout
+                logger.warning("%s timed out after %s ms, resetting the adaptive timeouts", header, self._timeout_ms)
+                self._timeouts.reset()
+            raise
+        elapsed = time.perf_counter() - start
+        if self._timeouts is not None:
+            self._timeouts.update(len(data), elapsed)
+        if self._metrics is not None:
+            self._metrics.record(op, header, elapsed, bytes_out, len(data))
+        return data
+
+    def _set_timeout(self, timeout_ms: int) -> None:
+        if timeout_ms != self._timeout_ms:
+            self.inst.timeout = timeout_ms
+            self._timeout_ms = timeout_ms
+
+    @contextmanager
+    def batch(self):
+        """
+        Collect every command written inside the block and send them as semicolon-joined
+        messages, as few as MAX_MESSAGE_LENGTH allows, when the block exits.
+
+        Queries and reads inside the block first send what has been collected so far, so
+        the order of operations is kept. Batches can be nested; only the outermost one sends.
+        If the block raises, the pending commands are dropped and the shadow state is reset.
+
+        Example:
+            with tek.batch():
+                tek.set_peak_power(300)
+                tek.set_horizontal("COL", 200e-3)
+                tek.set_vertical(5)
+        """
+        if self._batch is not None:
+            yield self
+            return
+        self._batch = []
+        try:
+            yield self
+            self._flush_batch()
+        except BaseException:
+            # Part of the batch was never sent, so the shadow cannot be trusted anymore
+            self._reset_shadow()
+            raise
+        finally:
+            self._batch = None
+
+    def _flush_batch(self) -> None:
+        """Send the commands collected by batch(), if any."""
+        if not self._batch:
+            return
+        commands, self._batch = self._batch, []
+        messages = [commands[0]]
+        for command in commands[1:]:
+            if len(messages[-1]) + 1 + len(command) <= self.MAX_MESSAGE_LENGTH:
+                messages[-1] += ";" + command
+            else:
+                messages.append(command)
+        for message in messages:
+            try:
+                self._send(message)
+            except Exception:
+                logger.error("Batched write failed: %s", message)
+                raise
+
+    def _write_setting(self, key: str, command: str) -> None:
+        """
+        Write a setting command unless the shadow shows it was already the last one written.
+        """
+        if self.coalesce_writes and self._written.get(key) == command:
+            return
+        self.write(command)
+        self._forget(key)
+        self._written[key] = command
+        if key == "PKP":
+            # The 371 may change the sensitivities to fit the new peak power range
+            self._forget("HOR")
+            self._forget("VER")
+
+    def _query_setting(self, query: str) -> str:
+        """
+        Answer a setting query from the shadow when its value is known, otherwise ask the 371.
+        """
+        if self.coalesce_writes and query in self._readback:
+            return self._readback[query]
+        response = self.query(query)
+        self._readback[query] = response
+        return response
+
+    def _forget(self, key: str) -> None:
+        """Drop what the shadow knows about a setting."""
+        self._written.pop(key, None)
+        self._readback.pop(_SETTING_QUERIES[key], None)
+        if key in _SCALE_SETTINGS:
+            self.invalidate_preamble()
+
+    def _reset_shadow(self) -> None:
+        self._written.clear()
+        self._readback.clear()
+        self.invalidate_preamble()
+
+    def settings_snapshot(self) -> dict:
+        """
+        Settings known to the driver, without any I/O: the last command written for every
+        setting, and the last response read back for every setting query.
+
+        Returns:
+            dict: {"written": {setting: command}, "readback": {query: response}}
+        """
+        return {"written": dict(self._written), "readback": dict(self._readback)}
+
+    def sync(self) -> str:
+        """
+        Re-read the instrument settings with a single SET? query and rebuild the shadow state from it.
+
+        Use it after settings were changed on the front panel, or through write() directly.
+        Getters answered from the shadow return the wording of the SET? response
+        (e.g. "VERT COLLECT:<size>" rather than "VER COL:<size>").
+
+        Returns:
+            str: The SET? response.
+        """
+        settings = self.get_settings()
+        self._reset_shadow()
+        query = None
+        for fragment in settings.strip().split(";"):
+            fragment = fragment.strip()
+            header = next((h for h in _SET_HEADERS if fragment.startswith(h)), None)
+            if header is not None:
+                query = _SET_HEADERS[header]
+                if query is not None:
+                    self._readback[query] = fragment
+            elif query is not None:
+                # Some fields (STEPGEN in sweep mode) contain a semicolon themselves
+                self._readback[query] += ";" + fragment
+        return settings
 
     def close(self) -> None:
         try:
@@ -48,9 +345,33 @@ class Tek371:
                     self.inst.disable_event(VI_EVENT_SERVICE_REQ, EventMechanism.all)
                 except Exception:
                     pass
-            self.inst.close()
+                try:
+                    self.inst.uninstall_handler(VI_EVENT_SERVICE_REQ, self._srq_handler, self._srq_user_handle)
+                except Exception:
+                    pass
+                self._srq_handler_installed = False
+                self._srq_enabled = False
+            if self._pool is None:
+                self.inst.close()
+            # Pooled sessions stay open for the next Tek371 on the same address, see SessionPool.close
         finally:
-            self.rm.close()
+            if self._metrics is not None and self.metrics_file:
+                self._metrics.dump(self.metrics_file)
+                logger.info("Metrics saved to %s", self.metrics_file)
+
+    @property
+    def metrics(self):
+        """The Metrics being recorded, or None if instrumentation is disabled."""
+        return self._metrics
+
+    def metrics_snapshot(self) -> dict:
+        """
+        Current I/O metrics (see Metrics.snapshot).
+
+        Returns:
+            dict: The snapshot, or None if the instrument was created without metrics.
+        """
+        return None if self._metrics is None else self._metrics.snapshot()
 
     # -----------------------------
     # Connection & Utilities
@@ -67,6 +388,7 @@ class Tek371:
             VER COL:1.0E+0, RQS ON, DEB OFF.
         """
         self.write(cmd.INI_SET)
+        self._reset_shadow()
 
     def id_string(self) -> str:
         """
@@ -142,7 +464,7 @@ class Tek371:
                 - "NPN" or "POS" (positive)
                 - "PNP" or "NEG" (negative)
         """
-        self.write(cmd.CSP_SET.format(mode=mode))
+        self._write_setting("CSP", cmd.CSP_SET.format(mode=mode))
 
     def get_collector_polarity(self) -> str:
         """
@@ -153,7 +475,7 @@ class Tek371:
                 - "NPN" for positive polarity
                 - "PNP" for negative polarity
         """
-        return self.query(cmd.CSP_QUERY)
+        return self._query_setting(cmd.CSP_QUERY)
 
     def set_peak_power(self, watts: int) -> None:
         """
@@ -163,7 +485,7 @@ class Tek371:
             watts (int): Peak power in watts. Accepted values:
                 - 3000, 300, 30, 3
         """
-        self.write(cmd.PKP_SET.format(set=watts))
+        self._write_setting("PKP", cmd.PKP_SET.format(set=watts))
 
     def get_peak_power(self) -> str:
         """
@@ -173,7 +495,7 @@ class Tek371:
             str: A response string in the format "PKPOWER <set>" where <set> is:
                 - 3000, 300, 30 or 3, in watts
         """
-        return self.query(cmd.PKP_QUERY)
+        return self._query_setting(cmd.PKP_QUERY)
 
     def set_collector_supply(self, percent: float) -> None:
         """
@@ -185,7 +507,7 @@ class Tek371:
         Notes:
             - 100.0% is approximately 30V
         """
-        self.write(cmd.VCS_SET.format(data=f"{percent:.1f}"))
+        self._write_setting("VCS", cmd.VCS_SET.format(data=f"{percent:.1f}"))
 
     def get_collector_supply(self) -> str:
         """
@@ -198,7 +520,7 @@ class Tek371:
         Notes:
             - 100.0% is approximately 30V
         """
-        return self.query(cmd.VCS_QUERY)
+        return self._query_setting(cmd.VCS_QUERY)
 
     def get_breaker_status(self) -> str:
         """
@@ -228,7 +550,7 @@ class Tek371:
                 - "NST" (non-store mode)
                 - "STO" (store mode)
         """
-        self.write(cmd.DIS_MODE_SET.format(mode=mode))
+        self._write_setting("DIS MODE", cmd.DIS_MODE_SET.format(mode=mode))
 
     def view_curve(self, index: int) -> None:
         """
@@ -239,6 +561,7 @@ class Tek371:
                 - 1 to 16
         """
         self.write(cmd.DIS_VIEW_SET.format(index=index))
+        self._forget("DIS MODE")
 
     def compare_curve(self, index: int) -> None:
         """
@@ -249,6 +572,7 @@ class Tek371:
                 - 1 to 16
         """
         self.write(cmd.DIS_COMP_SET.format(index=index))
+        self._forget("DIS MODE")
 
     def invert_display(self, status: str) -> None:
         """
@@ -259,7 +583,7 @@ class Tek371:
                 - "ON"
                 - "OFF" (default)
         """
-        self.write(cmd.DIS_INV_SET.format(status=status))
+        self._write_setting("DIS INV", cmd.DIS_INV_SET.format(status=status))
 
     def set_calibration(self, status: str) -> None:
         """
@@ -271,7 +595,7 @@ class Tek371:
                 - "OFF"
                 - "FUL"
         """
-        self.write(cmd.DIS_CAL_SET.format(status=status))
+        self._write_setting("DIS CAL", cmd.DIS_CAL_SET.format(status=status))
 
     def get_display_settings(self) -> str:
         """
@@ -283,7 +607,7 @@ class Tek371:
                 - mode2: INVERT:OFF or INVERT:ON
                 - mode3: CAL:ZERO, CAL:OFF, or CAL:FULL
         """
-        return self.query(cmd.DIS_QUERY)
+        return self._query_setting(cmd.DIS_QUERY)
 
     def store_display(self, index: int) -> None:
         """
@@ -313,7 +637,7 @@ class Tek371:
                             50.0 to 500.0 (if peak watts is 30W/3W)
                 - For STP: 100.0E-3 to 5.0
         """
-        self.write(cmd.HOR_SET.format(source=source, volt=f"{volt_div:.2E}"))
+        self._write_setting("HOR", cmd.HOR_SET.format(source=source, volt=f"{volt_div:.2E}"))
 
     def get_horizontal(self) -> str:
         """
@@ -324,7 +648,7 @@ class Tek371:
                 - <source> is COLLECT or STPGEN
                 - <volt> is sensitivity (volt/div) in scientific notation
         """
-        return self.query(cmd.HOR_QUERY)
+        return self._query_setting(cmd.HOR_QUERY)
 
     def set_vertical(self, amp_div: float) -> None:
         """
@@ -338,7 +662,7 @@ class Tek371:
                 - 100.0E-6 to 5.0E-3 when peak watts is 30 W
                 - 10.0E-6 to 500.0E-6 when peak watts is 3 W
         """
-        self.write(cmd.VER_SET.format(amp=f"{amp_div:.2E}"))
+        self._write_setting("VER", cmd.VER_SET.format(amp=f"{amp_div:.2E}"))
 
     def get_vertical(self) -> str:
         """
@@ -348,7 +672,7 @@ class Tek371:
             str: A response string in the format: "VER COL:<amp>" where <amp> is:
                 - sensitivity in A/div
         """
-        return self.query(cmd.VER_QUERY)
+        return self._query_setting(cmd.VER_QUERY)
 
     # -----------------------------
     # Step Generator
@@ -362,7 +686,7 @@ class Tek371:
                 - "ON"
                 - "OFF"
         """
-        self.write(cmd.STP_OUT_SET.format(mode=mode))
+        self._write_setting("STP OUT", cmd.STP_OUT_SET.format(mode=mode))
 
     def set_step_current(self, val: float) -> None:
         """
@@ -374,7 +698,7 @@ class Tek371:
                 - 1.0E-6 to 2.0E-3 when peak power is 30 W / 3 W
                 - 1.0E-3 to 2.0 when peak power is 3 kW / 300 W
         """
-        self.write(cmd.STP_CUR_SET.format(val=f"{val:.2E}"))
+        self._write_setting("STP SIZE", cmd.STP_CUR_SET.format(val=f"{val:.2E}"))
 
     def set_step_voltage(self, val: float) -> None:
         """
@@ -384,7 +708,7 @@ class Tek371:
             val (float): Voltage step size (volt/step). Accepted range:
                 - 200.0E-3 through 5.0 in a 1-2-5 sequence
         """
-        self.write(cmd.STP_VOL_SET.format(val=f"{val:.2E}"))
+        self._write_setting("STP SIZE", cmd.STP_VOL_SET.format(val=f"{val:.2E}"))
 
     def set_step_number(self, val: int) -> None:
         """
@@ -393,7 +717,7 @@ class Tek371:
             val (int): Number of steps. Accepted range:
                 - 0 to 5
         """
-        self.write(cmd.STP_NUM_SET.format(val=val))
+        self._write_setting("STP NUM", cmd.STP_NUM_SET.format(val=val))
 
     def invert_step(self, mode: str) -> None:
         """
@@ -403,7 +727,7 @@ class Tek371:
                 - "ON"
                 - "OFF"
         """
-        self.write(cmd.STP_INV_SET.format(mode=mode))
+        self._write_setting("STP INV", cmd.STP_INV_SET.format(mode=mode))
 
     def set_step_multiplier(self, mode: str) -> None:
         """
@@ -413,7 +737,7 @@ class Tek371:
                 - "ON"
                 - "OFF"
         """
-        self.write(cmd.STP_MUL_SET.format(mode=mode))
+        self._write_setting("STP MUL", cmd.STP_MUL_SET.format(mode=mode))
 
     def enable_step_offset(self, mode: str) -> None:
         """
@@ -424,7 +748,7 @@ class Tek371:
                 - "ON"
                 - "OFF"
         """
-        self.write(cmd.STP_OFF_MODE_SET.format(mode=mode))
+        self._write_setting("STP OFF MODE", cmd.STP_OFF_MODE_SET.format(mode=mode))
 
     def set_step_offset(self, val: float) -> None:
         """
@@ -435,7 +759,7 @@ class Tek371:
                 - 0 to 500 when step multiplication is ON
                 - 0 to 5 times the step/offset setting otherwise
         """
-        self.write(cmd.STP_OFF_SET.format(val=f"{val:.2f}"))
+        self._write_setting("STP OFF", cmd.STP_OFF_SET.format(val=f"{val:.2f}"))
 
     def get_step_settings(self) -> str:
         """
@@ -462,7 +786,19 @@ class Tek371:
                     - typ:size: CURRENT:size (A/step) or VOLTAGE:size (V/step)
                     - output: Output status ("ON" or "OFF")
         """
-        return self.query(cmd.STP_QUERY)
+        return self._query_setting(cmd.STP_QUERY)
+
+    def get_step_number(self) -> int:
+        """
+        Number of steps of the step generator (0–5), read from the step generator settings.
+
+        Raises:
+            ValueError: If the response does not contain the number of steps.
+        """
+        match = re.search(r"NUMBER:\s*(\d+)", self.get_step_settings())
+        if match is None:
+            raise ValueError("Number of steps not found in the step generator settings.")
+        return int(match.group(1))
 
     # -----------------------------
     # Measurement
@@ -479,6 +815,7 @@ class Tek371:
                 - SWE: Sweep
                 - SSW: Slow sweep
         """
+        # Never coalesced: writing SWE or SIN is what starts the measurement
         self.write(cmd.MEA_SET.format(mode=mode))
 
     def get_measurement_mode(self) -> str:
@@ -563,85 +900,172 @@ class Tek371:
     # Waveform & Curve
     # -----------------------------
 
-    def read_curve(self, filename: str) -> None:
+    def acquire_curve(self) -> Curve:
         """
-        Reads the curve from the instrument, parses and scales points,
-        and saves them to a CSV file.
+        Reads the curve from the instrument, parses and scales points, and returns
+        them in memory without touching the disk.
 
-        Args:
-            filename (str): Path to the output CSV file.
+        Returns:
+            Curve: Voltage/current arrays sorted by ascending current, raw codes,
+            parsed preamble and acquisition timestamp.
         """
+        preamble, raw_curve = self.read_curve_raw()
 
-        # Read preamble and split into array
-        preamble_array = self.read_preamble().split(",")
+        # Parse, scale and sort points by ascending current
+        return Curve.from_raw(raw_curve, preamble)
+
+    def acquire_family(self, n_curves: int = None) -> list:
+        """
+        Reads a step generator family (one curve per step, measured in a single sweep) and
+        splits it into one Curve per step, each sorted by ascending current.
 
-        # Extract values
-        nr_pt = int(preamble_array[2].split(":")[1].strip())  # NR.PT (number of points, set by the 371)
-        xmult = float(preamble_array[4].split(":")[1].strip())  # XMULT (x-axis gain, depends on horizontal sensitivity)
-        ymult = float(preamble_array[8].split(":")[1].strip())  # YMULT (y-axis gain, depends on vertical sensitivity)
-        xoff = int(preamble_array[6].split(":")[1].strip())  # XOFF (x-axis offset)
-        yoff = int(preamble_array[10].split(":")[1].strip())  # YOFF (y-axis offset)
+        Args:
+            n_curves (int): Number of curves in the family. Defaults to the number of steps + 1.
 
-        # Calculate expected bytes (just used to check all the waveform was received correctly)
+        Returns:
+            list: Curve objects in step order, with their step value in Curve.step.
+        """
+        if n_curves is None:
+            n_curves = self.get_step_number() + 1
+        preamble, raw_curve = self.read_curve_raw()
+        return decode_family(raw_curve, preamble, n_curves)
 
-        # ---- From the TEK371 manual ----
-        curve_head_len = 25
-        bytes_for_data_len = 2
-        bytes_for_checksum = 1
-        bytes_per_x = 2
-        bytes_per_y = 2
-        # ---- From the TEK371 manual ----
+    def read_curve_raw(self) -> tuple:
+        """
+        Reads the curve from the instrument without decoding it, so that decoding can be
+        done elsewhere (e.g. on a background worker while the next sweep runs).
 
-        points_to_read = nr_pt * (bytes_per_x + bytes_per_y)
-        expected_bytes = curve_head_len + bytes_for_data_len + points_to_read + bytes_for_checksum
+        Returns:
+            tuple: (preamble, raw_curve) where preamble is the (cached) Preamble and
+            raw_curve the checksum-verified bytes of the CURVE block.
+        """
+        # Get (cached) preamble and work out the exact number of bytes to read
+        preamble = self.get_preamble()
+        expected_bytes = curve_length(preamble.nr_pt)
 
         # Request curve and read exact number of bytes
-
         self.write(cmd.CUR_QUERY)
+        raw_curve = self._verified_curve(self.read_bytes(expected_bytes), expected_bytes)
+        return preamble, raw_curve
+
+    def read_curve(self, filename: str, sink=None) -> Curve:
+        """
+        Reads the curve from the instrument, parses and scales points,
+        and saves them to a file.
+
+        Args:
+            filename (str): Path to the output file.
+            sink: Object with a write(curve, filename) method. Defaults to CsvSink.
 
-        raw_curve = self.inst.read_bytes(expected_bytes)
-
-        # Parse and scale points
-        start_idx = curve_head_len + bytes_for_data_len
-        end_idx = len(raw_curve) - bytes_for_checksum
-        points_bytes = raw_curve[start_idx:end_idx] # Just extract waveform data, without preamble nor checksum
-
-        points = []
-        for i in range(0, len(points_bytes), 4): # Data is arranged in pairs of 4 bytes, 2 for X and 2 for Y
-            x_bytes = points_bytes[i:i + 2]
-            y_bytes = points_bytes[i + 2:i + 4]
-            if len(x_bytes) < 2 or len(y_bytes) < 2:
-                break
-            coord_x = int.from_bytes(x_bytes, byteorder="big", signed=False) - xoff # Adjust X-axis offset
-            coord_y = int.from_bytes(y_bytes, byteorder="big", signed=False) - yoff # Adjust Y-axis offset
-            voltage = coord_x * xmult # Apply X-axis gain
-            current = coord_y * ymult # Apply Y-axis gain
-            points.append((voltage, current))
-            # Due to how the 371 measures, it returns first the higher current values. To simplify post-processing
-            # we simply reorder it to ascending current
-            points.sort(key=lambda p: p[1])
-
-        # Check if we received and parsed correctly the measured waveform
-        if len(points) != nr_pt:
-            logger.error("Parsed points mismatch: got %s, expected %s", len(points), nr_pt)
-            raise ValueError(f"Number of points parsed ({len(points)}) does not match expected ({nr_pt}).")
-
-        # Save scaled points to CSV
-        with open(filename, "w", newline="") as f:
-            writer = csv.writer(f)
-            writer.writerow(["Voltage (V)", "Current (A)"])
-            writer.writerows(points)
-
-        logger.info(f"Curve saved to {filename}")
+        Returns:
+            Curve: The acquired curve.
+        """
+        curve = self.acquire_curve()
+        (CsvSink() if sink is None else sink).write(curve, filename)
+        return curve
 
     def read_preamble(self) -> str:
         return self.query(cmd.WFM_QUERY)
 
+    def _verified_curve(self, raw_curve: bytes, expected_bytes: int) -> bytes:
+        """
+        Check the checksum of a received CURVE block and, on a mismatch, re-issue only CUR?
+        (the sweep is not repeated) up to max_curve_retries times.
+
+        Raises:
+            ChecksumError: If every transfer was corrupted.
+        """
+        attempt = 0
+        while not verify_checksum(raw_curve):
+            if attempt >= self.max_curve_retries:
+                if self._metrics is not None:
+                    self._metrics.record_checksum_error()
+                logger.error("Curve checksum mismatch after %s retries", attempt)
+                raise ChecksumError(f"Curve checksum mismatch after {attempt} retries.")
+            attempt += 1
+            self.curve_retries += 1
+            if self._metrics is not None:
+                self._metrics.record_retry()
+            logger.warning("Curve checksum mismatch, re-reading curve (retry %s/%s)", attempt, self.max_curve_retries)
+            self.write(cmd.CUR_QUERY)
+            raw_curve = self.read_bytes(expected_bytes)
+        return raw_curve
+
+    def get_preamble(self) -> Preamble:
+        """
+        Parsed preamble of the current waveform, served from cache when possible.
+
+        WFM? is only queried when no preamble has been cached yet, or when the horizontal,
+        vertical, peak power, polarity or step number settings have been written since.
+
+        Notes:
+            - Only the scaling values (NR.PT, XMULT, XOFF, YMULT, YOFF) are guaranteed to be current.
+            - Changes made on the front panel are not seen; call sync or invalidate_preamble after them.
+
+        Returns:
+            Preamble: Parsed preamble.
+        """
+        key = self._scale_key()
+        if self._preamble_cache is None or self._preamble_cache[0] != key:
+            self._preamble_cache = (key, parse_preamble(self.read_preamble()))
+        return self._preamble_cache[1]
+
+    def invalidate_preamble(self) -> None:
+        """Forget the cached preamble so the next acquisition queries WFM? again."""
+        self._preamble_cache = None
+
+    def _scale_key(self) -> tuple:
+        return tuple(self._written.get(key) for key in _SCALE_SETTINGS)
+
     def read_waveform(self) -> str:
+        """
+        Text-only WAV? query. The curve part of the response is binary, use
+        read_waveform_raw or acquire_waveform to get usable data.
+        """
         return self.query(cmd.WAV_QUERY)
 
+    def read_waveform_raw(self) -> tuple:
+        """
+        Sends a single WAV? query and reads back both the preamble and the binary curve.
+
+        The 371 answers WAV? with the WFM? response and the CUR? response separated by a
+        semicolon, so the preamble is read as text up to the semicolon, and the NR.PT it
+        announces gives the exact number of curve bytes to read after it.
+
+        Returns:
+            tuple: (preamble, raw_curve) where preamble is the WFMPRE string and
+            raw_curve the bytes of the CURVE block (header, count, points and checksum).
+        """
+        self.write(cmd.WAV_QUERY)
+
+        # Read the preamble up to the separator, the curve block is binary and may contain any byte
+        termination = self.inst.read_termination
+        self.inst.read_termination = ";"
+        try:
+            preamble = self.read()
+        finally:
+            self.inst.read_termination = termination
+
+        expected_bytes = curve_length(parse_preamble(preamble).nr_pt)
+        raw_curve = self._verified_curve(self.read_bytes(expected_bytes), expected_bytes)
+        return preamble, raw_curve
+
+    def acquire_waveform(self) -> Curve:
+        """
+        Same as acquire_curve, but with a single WAV? round-trip instead of WFM? followed by CUR?.
+
+        Returns:
+            Curve: The acquired curve.
+        """
+        preamble, raw_curve = self.read_waveform_raw()
+        preamble = parse_preamble(preamble)
+        # The preamble comes for free with WAV?, keep the cache up to date
+        self._preamble_cache = (self._scale_key(), preamble)
+        return Curve.from_raw(raw_curve, preamble)
+
     def set_waveform_length(self, points: int) -> None:
         self.write(cmd.WFM_LENGTH_SET.format(points=points))
+        self.invalidate_preamble()  # NR.PT changes
 
     def get_waveform_length(self) -> str:
         return self.query(cmd.WFM_LENGTH_QUERY)
@@ -655,6 +1079,7 @@ class Tek371:
 
     def recall_settings(self, index: int) -> None:
         self.write(cmd.REC_SET.format(index=index))
+        self._reset_shadow()
 
     def get_output_status(self) -> str:
         return self.query(cmd.OUT_QUERY)
@@ -666,25 +1091,25 @@ class Tek371:
         return self.query(cmd.PST_QUERY)
 
     def debug_mode(self, status: str) -> None:
-        self.write(cmd.DEB_SET.format(status=status))
+        self._write_setting("DEB", cmd.DEB_SET.format(status=status))
 
     def get_debug_status(self) -> str:
-        return self.query(cmd.DEB_QUERY)
+        return self._query_setting(cmd.DEB_QUERY)
 
     def get_event_code(self) -> str:
         return self.query(cmd.EVE_QUERY)
 
     def set_opc(self, status: str) -> None:
-        self.write(cmd.OPC_SET.format(status=status))
+        self._write_setting("OPC", cmd.OPC_SET.format(status=status))
 
     def get_opc_status(self) -> str:
-        return self.query(cmd.OPC_QUERY)
+        return self._query_setting(cmd.OPC_QUERY)
 
     def set_rqs(self, status: str) -> None:
-        self.write(cmd.RQS_SET.format(status=status))
+        self._write_setting("RQS", cmd.RQS_SET.format(status=status))
 
     def get_rqs_status(self) -> str:
-        return self.query(cmd.RQS_QUERY)
+        return self._query_setting(cmd.RQS_QUERY)
 
     # -----------------------------
     # SRQ handling
@@ -701,67 +1126,96 @@ class Tek371:
             # Different VISA backends may behave slightly differently;
             # swallow harmless errors.
             pass
+        self._srq_enabled = False
 
     def enable_srq_event(self) -> None:
         """
         Enable SRQ at instrument level (OPC & RQS) and at controller level (VISA events).
-        Installs a handler that flips a flag when SRQ arrives.
+        Installs a handler that sets a threading.Event when SRQ arrives.
+
+        The handler is installed only once per session and removed by close(), so calling this
+        again only re-enables what is missing. Between sweeps, arm() is enough.
         """
         # 1) Ask instrument to assert SRQ when operations complete
         #    (these map to your commands.py)
-        self.write(cmd.OPC_SET.format(status="ON"))   # Operation Complete ON
-        self.write(cmd.RQS_SET.format(status="ON"))   # Service Request ON
+        self.set_opc("ON")   # Operation Complete ON
+        self.set_rqs("ON")   # Service Request ON
+
+        # 2) Install handler once, starting from a clean event configuration
+        if not self._srq_handler_installed:
+            self.discard_and_disable_all_events()
+
+            def _srq_handler(resource, event, user_handle):
+                # Wake up the waiter, and optionally you can query EVENT code here if you need to distinguish causes.
+                self._srq_time = time.perf_counter()
+                self._srq_event.set()
 
-        # 2) Reset state and clean previous event configuration
-        with self._srq_lock:
-            self._srq_called = False
-        self.discard_and_disable_all_events()
+            self._srq_handler = self.inst.wrap_handler(_srq_handler)
+            self._srq_user_handle = self.inst.install_handler(VI_EVENT_SERVICE_REQ, self._srq_handler, None)
+            self._srq_handler_installed = True
 
-        # 3) Install handler and enable SRQ delivery in VISA
-        def _srq_handler(resource, event, user_handle):
-            # Flip the flag, and optionally you can query EVENT code here if you need to distinguish causes.
-            with self._srq_lock:
-                self._srq_called = True
+        # 3) Enable SRQ delivery in VISA
+        if not self._srq_enabled:
+            self.inst.enable_event(VI_EVENT_SERVICE_REQ, EventMechanism.handler, None)
+            self._srq_enabled = True
 
-        wrapped = self.inst.wrap_handler(_srq_handler)
-        self.inst.install_handler(VI_EVENT_SERVICE_REQ, wrapped, None)
-        self.inst.enable_event(VI_EVENT_SERVICE_REQ, EventMechanism.handler, None)
-        self._srq_handler_installed = True
+        self.arm()
 
-    def wait_for_srq(self, poll_interval: float = 0.1, timeout_s: float = 30.0) -> bool:
+    def arm(self) -> None:
+        """
+        Forget any SRQ already received, so the next wait_for_srq only returns for the next operation.
+
+        Nothing is written to the instrument and the VISA handler is left installed, so this is
+        cheap enough to call before every sweep.
+        """
+        self._srq_event.clear()
+
+    def wait_for_srq(self, poll_interval: float = None, timeout_s: float = 30.0) -> bool:
         """
         Block until SRQ arrives (sweep complete), or timeout.
 
+        The SRQ handler sets a threading.Event, so this returns as soon as the handler runs
+        instead of on the next polling tick. Afterwards, last_srq_wait_s holds the time spent
+        waiting and last_srq_latency_s the delay between the handler and this method returning.
+
+        Args:
+            poll_interval (float): Not used anymore, kept for compatibility.
+            timeout_s (float): Maximum time to wait, in seconds.
+
         Returns:
             True if SRQ received before timeout, False otherwise.
         """
-        deadline = time.time() + timeout_s
-        while time.time() < deadline:
-            with self._srq_lock:
-                if self._srq_called:
-                    # reset for next operation
-                    self._srq_called = False
-                    return True
-            time.sleep(poll_interval)
-        return False
+        start = time.perf_counter()
+        received = self._srq_event.wait(timeout_s)
+        end = time.perf_counter()
+        self.last_srq_wait_s = end - start
+        if received:
+            # reset for next operation
+            self._srq_event.clear()
+            self.last_srq_latency_s = end - self._srq_time
+            logger.debug("SRQ received after %.3f s (latency %.6f s)", self.last_srq_wait_s, self.last_srq_latency_s)
+        else:
+            self.last_srq_latency_s = None
+        if self._metrics is not None:
+            self._metrics.record_srq_wait(self.last_srq_wait_s, self.last_srq_latency_s)
+        return received
 
     def disable_srq_event(self) -> None:
         """Disable SRQ generation in the instrument and stop VISA SRQ delivery."""
         # instrument side
         try:
-            self.write(cmd.RQS_SET.format(status="OFF"))
+            self.set_rqs("OFF")
         except Exception:
             pass
         try:
-            self.write(cmd.OPC_SET.format(status="OFF"))
+            self.set_opc("OFF")
         except Exception:
             pass
 
-        # controller side
+        # controller side, the handler itself stays installed until close()
         try:
             self.inst.disable_event(VI_EVENT_SERVICE_REQ, EventMechanism.all)
         except Exception:
             pass
-        self._srq_handler_installed = False
-        with self._srq_lock:
-            self._srq_called = False
+        self._srq_enabled = False
+        self._srq_event.clear()
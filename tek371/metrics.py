@@ -0,0 +1,174 @@
+"""
+metrics.py
+Opt-in I/O instrumentation of the Tek371 driver: latency histograms per command header,
+byte counters, curve retries and SRQ waits.
+
+Example:
+    tek = Tek371("GPIB0::23::INSTR", metrics=True, metrics_file="run_metrics.json")
+    ...
+    print(tek.metrics_snapshot()["commands"]["CUR?"])
+    tek.close()  # Also writes run_metrics.json
+"""
+import bisect
+import json
+import threading
+import time
+
+# Upper bounds of the latency histogram buckets, in seconds (the last bucket is unbounded)
+LATENCY_BUCKETS_S = (1e-4, 2e-4, 5e-4, 1e-3, 2e-3, 5e-3, 1e-2, 2e-2, 5e-2, 0.1, 0.2, 0.5, 1.0, 2.0, 5.0, 10.0,
+                     30.0, 60.0)
+
+
+def command_header(command: str) -> str:
+    """
+    Header a command is accounted under: its first word, e.g. "CUR?" for "CUR?",
+    "VCS" for "VCS 50.0" and "WFM?" for "WFM? NR.PT". Semicolon-joined messages are "BATCH".
+    """
+    if ";" in command:
+        return "BATCH"
+    parts = command.split(None, 1)
+    return parts[0].upper() if parts else ""
+
+
+class Histogram:
+    """Latency histogram over LATENCY_BUCKETS_S, with count, total, min and max."""
+
+    __slots__ = ("counts", "count", "total_s", "min_s", "max_s")
+
+    def __init__(self):
+        self.counts = [0] * (len(LATENCY_BUCKETS_S) + 1)
+        self.count = 0
+        self.total_s = 0.0
+        self.min_s = None
+        self.max_s = None
+
+    def add(self, seconds: float) -> None:
+        self.counts[bisect.bisect_left(LATENCY_BUCKETS_S, seconds)] += 1
+        self.count += 1
+        self.total_s += seconds
+        self.min_s = seconds if self.min_s is None else min(self.min_s, seconds)
+        self.max_s = seconds if self.max_s is None else max(self.max_s, seconds)
+
+    def to_dict(self) -> dict:
+        return {
+            "count": self.count,
+            "total_s": self.total_s,
+            "mean_s": self.total_s / self.count if self.count else None,
+            "min_s": self.min_s,
+            "max_s": self.max_s,
+            # Upper bound of every bucket ("inf" for the last one) and its count
+            "buckets": {f"{bound:g}": n for bound, n in zip(LATENCY_BUCKETS_S + (float("inf"),), self.counts)},
+        }
+
+
+class _CommandStats:
+    __slots__ = ("write", "read", "query", "bytes_out", "bytes_in")
+
+    def __init__(self):
+        self.write = Histogram()
+        self.read = Histogram()
+        self.query = Histogram()
+        self.bytes_out = 0
+        self.bytes_in = 0
+
+    def to_dict(self) -> dict:
+        result = {op: getattr(self, op).to_dict() for op in ("write", "read", "query") if getattr(self, op).count}
+        result["bytes_out"] = self.bytes_out
+        result["bytes_in"] = self.bytes_in
+        return result
+
+
+class Metrics:
+    """
+    Counters filled by Tek371 when created with metrics enabled.
+
+    Every write, read and query is timed and accounted under the header of its command.
+    Reads are accounted under the last query written (e.g. the read_bytes after CUR? goes to "CUR?").
+    Recording is thread-safe, as wait_for_srq may run on a different thread than the I/O (see aio.py).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._commands = {}
+        self._srq_wait = Histogram()
+        self._srq_latency = Histogram()
+        self.srq_timeouts = 0
+        self.curve_retries = 0
+        self.checksum_errors = 0
+        self.created = time.time()
+
+    def record(self, op: str, header: str, elapsed_s: float, bytes_out: int = 0, bytes_in: int = 0) -> None:
+        """
+        Account one I/O call.
+
+        Args:
+            op (str): "write", "read" or "query".
+            header (str): Command header, see command_header.
+            elapsed_s (float): Duration of the call.
+            bytes_out (int): Bytes sent.
+            bytes_in (int): Bytes received.
+        """
+        with self._lock:
+            stats = self._commands.get(header)
+            if stats is None:
+                stats = self._commands[header] = _CommandStats()
+            getattr(stats, op).add(elapsed_s)
+            stats.bytes_out += bytes_out
+            stats.bytes_in += bytes_in
+
+    def record_srq_wait(self, wait_s: float, latency_s: float = None) -> None:
+        """Account one wait_for_srq; latency_s is None if it timed out."""
+        with self._lock:
+            self._srq_wait.add(wait_s)
+            if latency_s is None:
+                self.srq_timeouts += 1
+            else:
+                self._srq_latency.add(latency_s)
+
+    def record_retry(self) -> None:
+        with self._lock:
+            self.curve_retries += 1
+
+    def record_checksum_error(self) -> None:
+        with self._lock:
+            self.checksum_errors += 1
+
+    def snapshot(self) -> dict:
+        """
+        Current state of every counter, as plain JSON-serializable data.
+
+        Returns:
+            dict: {"commands": {header: {...}}, "bytes_out", "bytes_in", "srq": {...}, "curve_retries", ...}
+        """
+        with self._lock:
+            commands = {header: stats.to_dict() for header, stats in sorted(self._commands.items())}
+            return {
+                "created": self.created,
+                "snapshot": time.time(),
+                "commands": commands,
+                "bytes_out": sum(stats["bytes_out"] for stats in commands.values()),
+                "bytes_in": sum(stats["bytes_in"] for stats in commands.values()),
+                "srq": {
+                    "wait": self._srq_wait.to_dict(),
+                    "latency": self._srq_latency.to_dict(),
+                    "timeouts": self.srq_timeouts,
+                },
+                "curve_retries": self.curve_retries,
+                "checksum_errors": self.checksum_errors,
+            }
+
+    def dump(self, filename: str) -> None:
+        """Write the snapshot to a JSON file."""
+        with open(filename, "w", encoding="utf-8") as f:
+            json.dump(self.snapshot(), f, indent=2)
+
+    def reset(self) -> None:
+        """Clear every counter."""
+        with self._lock:
+            self._commands.clear()
+            self._srq_wait = Histogram()
+            self._srq_latency = Histogram()
+            self.srq_timeouts = 0
+            self.curve_retries = 0
+            self.checksum_errors = 0
+            self.created = time.time()
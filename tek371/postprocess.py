@@ -0,0 +1,342 @@
+"""
+postprocess.py
+Post-processing of saved I-V curves, shared by the acquisition scripts and offline reprocessing.
+
+All the repeats of a run are loaded into a single (N, points, 2) array and reduced with
+vectorized NumPy operations, so thousands of historical files are processed in seconds.
+
+Every curve is sorted by its own measured current, which jitters from sweep to sweep, so row r
+of two repeats is not the same operating point. resample() puts all the repeats on a common
+current (or voltage) grid by linear interpolation before they are averaged, which is what the
+mean and statistics files are computed from unless --grid none is given.
+
+Offline usage:
+    python -m tek371.postprocess <folder> <base_name> <N> [--stats] [--grid current|voltage|none]
+    python -m tek371.postprocess <run file.t371> [--stats] [--grid current|voltage|none]
+"""
+import argparse
+import csv
+import os
+
+import numpy as np
+
+from .container import RunReader
+from .stats import write_stats_table
+
+import logging
+logger = logging.getLogger(__name__)
+
+HEADER = ["Voltage (V)", "Current (A)"]
+GRID_AXES = {"voltage": 0, "current": 1}
+
+
+def load_curve_file(path: str) -> np.ndarray:
+    """
+    Load one two-column curve CSV file (with a header row) with NumPy's C parser.
+
+    Args:
+        path (str): Path to the file.
+
+    Returns:
+        numpy.ndarray: Array of shape (points, 2), voltage in column 0 and current in column 1.
+
+    Raises:
+        ValueError: If the file is not a two-column table of numbers.
+    """
+    try:
+        points = np.loadtxt(path, delimiter=",", skiprows=1, ndmin=2, encoding="utf-8")
+    except ValueError as e:
+        raise ValueError(f"{path} is not a two-column table of numbers: {e}") from None
+    if points.shape[1] != 2:
+        raise ValueError(f"{path} has {points.shape[1]} columns, expected voltage and current.")
+    return points
+
+
+def load_curve_files(paths: list) -> np.ndarray:
+    """
+    Load many curve files into a single array.
+
+    Args:
+        paths (list): Paths to the curve CSV files.
+
+    Returns:
+        numpy.ndarray: Array of shape (N, points, 2).
+
+    Raises:
+        ValueError: If the files do not all have the same number of points.
+    """
+    curves = [load_curve_file(path) for path in paths]
+    lengths = {len(curve) for curve in curves}
+    if len(lengths) > 1:
+        mismatched = [path for path, curve in zip(paths, curves) if len(curve) != len(curves[0])]
+        raise ValueError(f"Curve files have different numbers of points {sorted(lengths)}, e.g. {mismatched[0]}.")
+    return np.stack(curves)
+
+
+def run_paths(folder_path: str, base_name: str, N: int, extension: str = ".csv") -> list:
+    """Paths of the curves of a run: {folder}/{base_name}_1.csv ... {folder}/{base_name}_{N}.csv"""
+    return [os.path.join(folder_path, f"{base_name}_{i}{extension}") for i in range(1, N + 1)]
+
+
+def load_run(folder_path: str, base_name: str, N: int) -> np.ndarray:
+    """Load the N curve files of a run into an array of shape (N, points, 2)."""
+    return load_curve_files(run_paths(folder_path, base_name, N))
+
+
+def load_run_file(filename: str) -> np.ndarray:
+    """Load the curves of a run file (see container.py) into an array of shape (N, points, 2)."""
+    with RunReader(filename) as run:
+        return run.points()
+
+
+def collapse_ties(x: np.ndarray, y: np.ndarray) -> tuple:
+    """
+    Merge the points of a curve that share the same x, averaging their y.
+
+    The 371 digitizes with 10 bits, so neighbouring points of a curve often have the same current
+    (or voltage) code. Interpolation needs strictly ascending x.
+
+    Args:
+        x (numpy.ndarray): Ascending array of shape (points,).
+        y (numpy.ndarray): Array of shape (points,).
+
+    Returns:
+        tuple: (x, y) arrays with one point per distinct x.
+    """
+    first = np.empty(len(x), dtype=bool)
+    first[:1] = True
+    np.not_equal(x[1:], x[:-1], out=first[1:])
+    if first.all():
+        return x, y
+    starts = np.flatnonzero(first)
+    return x[starts], np.add.reduceat(y, starts) / np.diff(np.append(starts, len(x)))
+
+
+def interpolate(x, y, grid: np.ndarray) -> np.ndarray:
+    """
+    Linear interpolation of N curves onto the same grid.
+
+    Args:
+        x (numpy.ndarray | list): Array of shape (N, points), or N arrays of any length, each
+            ascending. Points with the same x are averaged first (see collapse_ties).
+        y (numpy.ndarray | list): Same shape as x.
+        grid (numpy.ndarray): Ascending array of shape (M,), within the range of every row.
+
+    Returns:
+        numpy.ndarray: Array of shape (N, M), y of every curve at the grid points.
+    """
+    # np.interp walks the grid and a row together in C. A single searchsorted over all the rows
+    # (each shifted by a row offset) measured 3-4x slower than this loop, even for thousands of rows.
+    out = np.empty((len(x), len(grid)))
+    for row, (x_row, y_row) in enumerate(zip(x, y)):
+        out[row] = np.interp(grid, *collapse_ties(x_row, y_row))
+    return out
+
+
+def common_grid(x, points: int) -> np.ndarray:
+    """
+    Evenly spaced grid over the range covered by every curve.
+
+    Args:
+        x (numpy.ndarray | list): Array of shape (N, points), or N arrays of any length, of the grid
+            quantity of every curve.
+        points (int): Number of grid points.
+
+    Raises:
+        ValueError: If the curves do not share any range.
+    """
+    low = max(row.min() for row in x)
+    high = min(row.max() for row in x)
+    if not low < high:
+        raise ValueError(f"Curves have no common range to resample on ({low:g} to {high:g}).")
+    return np.linspace(low, high, points)
+
+
+def resample(curves, grid: str = "current", points: int = None) -> np.ndarray:
+    """
+    Put every repeat of a run on a common grid, so that the same row of every curve is the same
+    operating point and per-row statistics are meaningful.
+
+    Args:
+        curves (numpy.ndarray | list): Array of shape (N, points, 2), or N arrays of shape (points, 2)
+            with any number of points, voltage in column 0 and current in column 1.
+        grid (str): Quantity of the common grid, "current" or "voltage". The other one is interpolated.
+        points (int): Number of grid points. Defaults to the number of points of the first curve.
+
+    Returns:
+        numpy.ndarray: Array of shape (N, points, 2) over the range shared by all the curves.
+
+    Raises:
+        ValueError: If grid is unknown or the curves do not share any range.
+    """
+    try:
+        axis = GRID_AXES[grid]
+    except KeyError:
+        raise ValueError(f"Unknown grid '{grid}', expected one of {sorted(GRID_AXES)}.") from None
+    x = []
+    y = []
+    for curve in curves:
+        order = np.argsort(curve[:, axis], kind="stable")
+        x.append(curve[order, axis])
+        y.append(curve[order, 1 - axis])
+
+    values = common_grid(x, len(x[0]) if points is None else points)
+    resampled = np.empty((len(x), len(values), 2))
+    resampled[:, :, axis] = values
+    resampled[:, :, 1 - axis] = interpolate(x, y, values)
+    return resampled
+
+
+def summarize(curves: np.ndarray) -> dict:
+    """
+    Per-point statistics across repeats.
+
+    Args:
+        curves (numpy.ndarray): Array of shape (N, points, 2).
+
+    Returns:
+        dict: "mean", "median", "std" (sample, NaN for a single curve), "min" and "max",
+        each an array of shape (points, 2).
+    """
+    return {
+        "mean": curves.mean(axis=0),
+        "median": np.median(curves, axis=0),
+        "std": curves.std(axis=0, ddof=1) if len(curves) > 1 else np.full(curves.shape[1:], np.nan),
+        "min": curves.min(axis=0),
+        "max": curves.max(axis=0),
+    }
+
+
+def write_points(filename: str, points: np.ndarray, header: list = HEADER) -> None:
+    """Write an array of shape (points, columns) as a CSV file with a header row."""
+    with open(filename, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(header)
+        writer.writerows(points.tolist())
+
+
+def summary_paths(folder_path: str, base_name: str) -> tuple:
+    """Paths of the mean and statistics files of a run: {folder}/mean/{base_name}_MEAN.csv and _STATS.csv"""
+    mean_folder = os.path.join(folder_path, "mean")
+    return (os.path.join(mean_folder, f"{base_name}_MEAN.csv"),
+            os.path.join(mean_folder, f"{base_name}_STATS.csv"))
+
+
+def compute_mean_file(folder_path: str, base_name: str, N: int, stats: bool = False,
+                      grid: str = "current") -> str:
+    """
+    Compute the mean of Voltage and Current across N files:
+    {folder}/{base_name}_1.csv ... {folder}/{base_name}_{N}.csv
+    Save result as {folder}/mean/{base_name}_MEAN.csv.
+
+    Args:
+        folder_path (str): Folder of the curve files.
+        base_name (str): Name of the curve files, without the _<i>.csv suffix.
+        N (int): Number of curve files.
+        stats (bool): Also save the standard deviation, min/max and 95% confidence band as
+            {folder}/mean/{base_name}_STATS.csv.
+        grid (str): "current" or "voltage" to resample every curve on a common grid first (see resample).
+            None averages row by row.
+
+    Returns:
+        str: Path of the mean file.
+    """
+    return write_summary(load_run(folder_path, base_name, N), folder_path, base_name, stats, grid)[0]
+
+
+def compute_mean_run_file(filename: str, stats: bool = False, grid: str = "current") -> str:
+    """
+    Same as compute_mean_file, for the curves of a run file {folder}/{base_name}.t371.
+    Save result as {folder}/mean/{base_name}_MEAN.csv.
+
+    Returns:
+        str: Path of the mean file.
+    """
+    folder_path, name = os.path.split(filename)
+    return write_summary(load_run_file(filename), folder_path, os.path.splitext(name)[0], stats, grid)[0]
+
+
+def write_summary(curves, folder_path: str, base_name: str, stats: bool = False, grid: str = "current") -> tuple:
+    """
+    Save the mean of repeated curves as {folder}/mean/{base_name}_MEAN.csv, and optionally their
+    std, min/max and 95% confidence band as {folder}/mean/{base_name}_STATS.csv.
+
+    Args:
+        curves (numpy.ndarray | list): Array of shape (N, points, 2), or N arrays of shape (points, 2).
+        folder_path (str): Folder of the curve files.
+        base_name (str): Name of the curve files, without the _<i>.csv suffix.
+        stats (bool): Also save the statistics file.
+        grid (str): "current" or "voltage" to resample every curve on a common grid first (see resample).
+            None averages row by row, which needs curves of the same number of points.
+
+    Returns:
+        tuple: Paths of the mean file and of the statistics file (None if stats is False).
+    """
+    N = len(curves)
+    if grid is not None:
+        curves = resample(curves, grid)
+    elif len({len(curve) for curve in curves}) > 1:
+        raise ValueError("Curves of different numbers of points can only be averaged on a common grid.")
+    summary = summarize(np.asarray(curves))
+
+    # Create 'mean' subfolder if it doesn't exist
+    out_path, stats_path = summary_paths(folder_path, base_name)
+    os.makedirs(os.path.dirname(out_path), exist_ok=True)
+
+    # Save mean file in the subfolder
+    write_points(out_path, summary["mean"])
+    logger.info(f"Mean of {N} curves saved to {out_path}")
+
+    if not stats:
+        return out_path, None
+    write_stats_table(stats_path, N, summary["mean"], summary["std"], summary["min"], summary["max"])
+    return out_path, stats_path
+
+
+def write_statistics(stats, folder_path: str, base_name: str) -> tuple:
+    """
+    Save the mean curve accumulated while the curves arrived as {folder}/mean/{base_name}_MEAN.csv,
+    and the per-point std, min/max and 95% confidence band as {folder}/mean/{base_name}_STATS.csv.
+
+    The statistics are per row, as the curves were added. Use write_summary to average repeats
+    on a common grid.
+
+    Args:
+        stats (CurveStatistics): Accumulated statistics of the run.
+        folder_path (str): Folder of the curve files.
+        base_name (str): Name of the curve files, without the _<i>.csv suffix.
+
+    Returns:
+        tuple: Paths of the mean and statistics files.
+    """
+    # Create 'mean' subfolder if it doesn't exist
+    out_path, stats_path = summary_paths(folder_path, base_name)
+    os.makedirs(os.path.dirname(out_path), exist_ok=True)
+
+    # Save mean and statistics files in the subfolder
+    stats.write_mean(out_path)
+    stats.write_stats(stats_path)
+    return out_path, stats_path
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description="Recompute the mean file of a run from its curve files or run file.")
+    parser.add_argument("source", nargs="+", help="<folder> <base_name> <N> for CSV curve files, or <run file>")
+    parser.add_argument("--stats", action="store_true", help="Also write std, min/max and 95%% confidence band")
+    parser.add_argument("--grid", choices=sorted(GRID_AXES) + ["none"], default="current",
+                        help="Common grid the curves are resampled on before averaging (default: current), "
+                             "none to average them row by row")
+    args = parser.parse_args(argv)
+    grid = None if args.grid == "none" else args.grid
+    if len(args.source) == 1:
+        out_path = compute_mean_run_file(args.source[0], args.stats, grid)
+    elif len(args.source) == 3:
+        folder_path, base_name, N = args.source
+        out_path = compute_mean_file(folder_path, base_name, int(N), args.stats, grid)
+    else:
+        parser.error("expected <folder> <base_name> <N> or <run file>")
+    print(f"Mean file written: {out_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+"""
+preamble.py
+Parsing of the TEK371 WFMPRE response (WFM? query, or first part of WAV?) into a typed record.
+"""
+import re
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import Optional
+
+# WFID is matched up to the ENCDG field, so commas or slashes in the user TEXT cannot shift other fields
+_WFID_RE = re.compile(r"WFID:(?P<wfid>.*?),\s*ENCDG:")
+_FIELD_RE = re.compile(r"(?:^|,)\s*(?P<key>ENCDG|NR\.PT|PT\.FMT|XMULT|XZERO|XOFF|XUNIT|YMULT|YZERO|YOFF|YUNIT|BYT/NR|BN\.FMT|"
+                       r"BIT/NR|CRVCHK|LN\.FMT):(?P<value>[^,]*)")
+_WFID_KEYS = "INDEX|VERT|HORIZ|STEP|OFFSET|BGM|VCS|TEXT|HSNS"
+_WFID_FIELD_RE = re.compile(rf"(?P<key>{_WFID_KEYS})\s*(?P<value>.*?)\s*(?=/\s*(?:{_WFID_KEYS})\b|$)")
+
+
+@dataclass(frozen=True)
+class Preamble:
+    """
+    Parsed WFMPRE response.
+
+    Attributes:
+        nr_pt (int): Number of points in the curve (1 through 1024).
+        xmult (float): Horizontal scale factor.
+        xoff (int): Horizontal offset.
+        ymult (float): Vertical scale factor.
+        yoff (int): Vertical offset.
+        xzero, yzero (float): Horizontal and vertical zero (always 0 on the 371).
+        xunit, yunit (str): Horizontal and vertical units ("V" and "A").
+        ln_fmt (str): VECTOR, DOT or SWEEP <cnt>.
+        index (int): Display address, 0 for CRT, 1...16 for memory location.
+        vert (float): Vertical sensitivity in A/div.
+        horiz (float): Horizontal sensitivity in V/div.
+        step (float): Step amplitude in V or A/step.
+        offset (float): Step offset in V or A.
+        bgm (str): Beta or gm readout.
+        vcs (float): Collector Supply Variable setting in %.
+        text (str): Readout of the text area.
+        hsns (str): Horizontal source, VCE or VBE.
+        raw (str): Original response string.
+    """
+    nr_pt: int
+    xmult: float
+    xoff: int
+    ymult: float
+    yoff: int
+    xzero: float = 0.0
+    yzero: float = 0.0
+    xunit: str = "V"
+    yunit: str = "A"
+    ln_fmt: str = ""
+    index: Optional[int] = None
+    vert: Optional[float] = None
+    horiz: Optional[float] = None
+    step: Optional[float] = None
+    offset: Optional[float] = None
+    bgm: Optional[str] = None
+    vcs: Optional[float] = None
+    text: Optional[str] = None
+    hsns: Optional[str] = None
+    raw: str = field(default="", repr=False, compare=False)
+
+
+def _number(value: Optional[str], kind=float):
+    if value is None:
+        return None
+    try:
+        return kind(float(value)) if kind is int else kind(value)
+    except ValueError:
+        return None
+
+
+@lru_cache(maxsize=64)
+def parse_preamble(preamble: str) -> Preamble:
+    """
+    Parse a WFMPRE response by field name rather than by position.
+
+    Results are memoized on the raw string, so repeated identical preambles are not parsed again.
+
+    Args:
+        preamble (str): Response to WFM? in the format
+            "WFMPRE WFID:<wfid>,ENCDG:BIN,NR.PT:<point>,PT.FMT:XY,XMULT:<x multi>,XZERO:0,XOFF:<xoff>,..."
+
+    Returns:
+        Preamble: The parsed record.
+
+    Raises:
+        ValueError: If any of NR.PT, XMULT, XOFF, YMULT or YOFF is missing or malformed.
+    """
+    wfid_match = _WFID_RE.search(preamble)
+    body = preamble[wfid_match.end() - len("ENCDG:"):] if wfid_match else preamble
+    fields = {m.group("key"): m.group("value").strip() for m in _FIELD_RE.finditer(body)}
+
+    wfid = {}
+    if wfid_match:
+        wfid_text = wfid_match.group("wfid").strip().strip('"')
+        wfid = {m.group("key"): m.group("value") for m in _WFID_FIELD_RE.finditer(wfid_text)}
+
+    try:
+        return Preamble(
+            nr_pt=int(fields["NR.PT"]),
+            xmult=float(fields["XMULT"]),
+            xoff=int(fields["XOFF"]),
+            ymult=float(fields["YMULT"]),
+            yoff=int(fields["YOFF"]),
+            xzero=_number(fields.get("XZERO")) or 0.0,
+            yzero=_number(fields.get("YZERO")) or 0.0,
+            xunit=fields.get("XUNIT", "V"),
+            yunit=fields.get("YUNIT", "A"),
+            ln_fmt=fields.get("LN.FMT", ""),
+            index=_number(wfid.get("INDEX"), int),
+            vert=_number(wfid.get("VERT")),
+            horiz=_number(wfid.get("HORIZ")),
+            step=_number(wfid.get("STEP")),
+            offset=_number(wfid.get("OFFSET")),
+            bgm=wfid.get("BGM"),
+            vcs=_number(wfid.get("VCS")),
+            text=wfid.get("TEXT"),
+            hsns=wfid.get("HSNS"),
+            raw=preamble,
+        )
+    except (KeyError, ValueError) as e:
+        raise ValueError(f"Malformed preamble ({e}): {preamble!r}") from None
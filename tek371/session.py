@@ -0,0 +1,183 @@
+"""
+session.py
+Process-wide pool of VISA sessions sharing a single pyvisa ResourceManager.
+
+Opening a ResourceManager and scanning the bus are slow with the NI backend, so the pool
+opens the ResourceManager once, caches list_resources() for a few seconds, and keeps the
+sessions (and instrument objects such as PyMeasure's Keithley2400, built on an adapter over
+the pooled session) open by address, so later campaign steps get them back without
+connecting again.
+
+Example:
+    pool = get_pool()
+    print(pool.list_resources())
+    tek = Tek371("GPIB0::23::INSTR")  # Uses the pool by default
+    smu = pool.instrument("GPIB::24", Keithley2400)
+"""
+import atexit
+import threading
+import time
+
+import pyvisa
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+class SessionPool:
+    """
+    Shared ResourceManager, cached bus scan and reusable sessions by address.
+
+    Args:
+        visa_library (str): PyVISA backend, "" for the default one.
+        resources_ttl_s (float): How long a list_resources result is reused, in seconds.
+    """
+
+    def __init__(self, visa_library: str = "", resources_ttl_s: float = 30.0):
+        self.visa_library = visa_library
+        self.resources_ttl_s = resources_ttl_s
+        self._lock = threading.RLock()
+        self._rm = None
+        self._resources = {}  # query -> (monotonic time, resources)
+        self._sessions = {}  # address -> open pyvisa resource
+        self._instruments = {}  # address -> instrument object built by a factory
+
+    @property
+    def resource_manager(self) -> pyvisa.ResourceManager:
+        """The shared ResourceManager, opened on first use."""
+        with self._lock:
+            if self._rm is None:
+                self._rm = pyvisa.ResourceManager(self.visa_library)
+            return self._rm
+
+    def list_resources(self, query: str = "?*::INSTR", refresh: bool = False) -> tuple:
+        """
+        Addresses of the connected instruments, rescanning the bus at most once per resources_ttl_s.
+
+        Args:
+            query (str): VISA resource expression, as for ResourceManager.list_resources.
+            refresh (bool): Rescan even if the cached result is still fresh.
+
+        Returns:
+            tuple: The matching resource addresses.
+        """
+        with self._lock:
+            cached = self._resources.get(query)
+            if not refresh and cached is not None and time.monotonic() - cached[0] < self.resources_ttl_s:
+                return cached[1]
+            resources = self.resource_manager.list_resources(query)
+            self._resources[query] = (time.monotonic(), resources)
+            return resources
+
+    def open_resource(self, address: str, **kwargs):
+        """
+        Session to address, reused if one is already open.
+
+        Args:
+            address (str): VISA resource address, e.g. "GPIB0::23::INSTR".
+            kwargs: Passed to ResourceManager.open_resource when a new session is opened.
+
+        Returns:
+            pyvisa.resources.Resource: The open session.
+        """
+        with self._lock:
+            session = self._sessions.get(address)
+            if session is not None and self._is_open(session):
+                return session
+            session = self.resource_manager.open_resource(address, **kwargs)
+            self._sessions[address] = session
+            logger.debug("Opened VISA session to %s", address)
+            return session
+
+    def visa_adapter(self, address: str):
+        """
+        PyMeasure VISAAdapter on the pooled session to address (see open_resource), so PyMeasure
+        instruments share the ResourceManager and sessions of the pool instead of opening their own.
+
+        Args:
+            address (str): VISA resource address.
+
+        Returns:
+            PooledVISAAdapter: Adapter whose connection is the pooled session, left open when it is closed.
+        """
+        from .adapters import PooledVISAAdapter
+
+        return PooledVISAAdapter(self.open_resource(address), self.resource_manager)
+
+    def owns(self, session) -> bool:
+        """Whether session is one of the pooled sessions, which stay open for the other users of the pool."""
+        with self._lock:
+            return any(session is pooled for pooled in self._sessions.values())
+
+    def instrument(self, address: str, factory, visa_adapter: bool = True):
+        """
+        Instrument object for address, built once and reused afterwards.
+
+        Example:
+            smu = pool.instrument("GPIB::24", Keithley2400)
+
+        Args:
+            address (str): Instrument address.
+            factory: Callable building the instrument, e.g. a PyMeasure class.
+            visa_adapter (bool): Build it with factory(visa_adapter(address)), on the pooled session.
+                If False, with factory(address), e.g. for the simulators of tek371.sim.
+
+        Returns:
+            The instrument object.
+        """
+        with self._lock:
+            instrument = self._instruments.get(address)
+            if instrument is None:
+                instrument = factory(self.visa_adapter(address) if visa_adapter else address)
+                self._instruments[address] = instrument
+            return instrument
+
+    def discard(self, address: str) -> None:
+        """Close and forget the session and instrument object of address, e.g. after an I/O error."""
+        with self._lock:
+            session = self._sessions.pop(address, None)
+            instrument = self._instruments.pop(address, None)
+        if session is not None:
+            _close_quietly(session)
+        # A no-op for a PooledVISAAdapter, whose session was closed just above
+        if instrument is not None and hasattr(instrument, "adapter"):
+            _close_quietly(instrument.adapter)
+
+    def close(self) -> None:
+        """Close every session and instrument object, then the ResourceManager."""
+        with self._lock:
+            for address in list(self._sessions) + list(self._instruments):
+                self.discard(address)
+            self._resources.clear()
+            if self._rm is not None:
+                _close_quietly(self._rm)
+                self._rm = None
+
+    @staticmethod
+    def _is_open(session) -> bool:
+        try:
+            session.session
+        except pyvisa.errors.InvalidSession:
+            return False
+        return True
+
+
+def _close_quietly(resource) -> None:
+    try:
+        resource.close()
+    except Exception as e:
+        logger.debug("Ignoring error on close: %s", e)
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool() -> SessionPool:
+    """The process-wide SessionPool, created on first use and closed at exit."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = SessionPool()
+            atexit.register(_pool.close)
+        return _pool
@@ -0,0 +1,479 @@
+"""
+sim.py
+In-process simulators of the TEK371 and of the Keithley 2400 SMUs used by the scripts, to run
+the driver and the acquisition scripts without a GPIB bus.
+
+SimulatedTek371Resource behaves like the PyVISA resource Tek371 opens: it understands the command
+set in commands.py, answers WFM?/CUR?/WAV? with correctly framed preamble and binary CURVE blocks
+(with valid checksums), and calls the installed SRQ handler when a sweep completes.
+
+Example:
+    tek = Tek371(SimulatedTek371Resource(sweep_time_s=0.2))
+"""
+import random
+import threading
+import time
+
+import numpy as np
+
+from pyvisa.constants import VI_EVENT_SERVICE_REQ
+
+from .curve import CURVE_HEAD_LEN
+
+import logging
+logger = logging.getLogger(__name__)
+
+# Power-up settings, as set by INI
+_INI_SETTINGS = {
+    "display": "STORE",
+    "dis_inv": "OFF",
+    "dis_cal": "OFF",
+    "stp_out": "OFF",
+    "stp_type": "CURRENT",
+    "stp_size": 1.0e-3,
+    "stp_offset": 0.0,
+    "stp_off_mode": "OFF",
+    "stp_inv": "OFF",
+    "stp_mul": "OFF",
+    "stp_num": 2,
+    "pkp": 300,
+    "csp": "NPN",
+    "hor_source": "COLLECT",
+    "hor": 1.0,
+    "ver": 1.0,
+    "opc": "OFF",
+    "rqs": "ON",
+    "mea": "REPEAT",
+    "vcs": 0.0,
+    "deb": "OFF",
+    "cursor": "OFF",
+    "text": "",
+    "nr_pt": None,
+}
+
+_MEASURE_NAMES = {"REP": "REPEAT", "SIN": "SINGLE", "SWE": "SWEEP", "SSW": "SSWEEP"}
+_DISPLAY_NAMES = {"NST": "NSTORE", "STO": "STORE"}
+_CAL_NAMES = {"ZER": "ZERO", "OFF": "OFF", "FUL": "FULL"}
+
+
+class SimulatedTek371Resource:
+    """
+    Simulated VISA resource of a TEK371 measuring an IGBT.
+
+    Args:
+        sweep_time_s (float): Time between starting a single or sweep measurement and its SRQ.
+        turnaround_s (float): Time spent on every write (command or query) on the bus.
+        bytes_per_s (float): Bus throughput used to delay reads.
+        noise_codes (float): Standard deviation of the noise added to the X/Y codes.
+        corrupt_rate (float): Probability of a CURVE block being sent with a wrong checksum.
+        gate_voltage (float): Gate-emitter voltage applied externally when the step generator is not used.
+        threshold_voltage (float): Gate threshold voltage of the simulated device.
+        transconductance (float): Saturation current gain, in A/V^2.
+        seed (int): Seed of the random generator, for repeatable runs.
+    """
+
+    def __init__(self, sweep_time_s: float = 1.0, turnaround_s: float = 0.002, bytes_per_s: float = 100e3,
+                 noise_codes: float = 1.0, corrupt_rate: float = 0.0, gate_voltage: float = 15.0,
+                 threshold_voltage: float = 5.5, transconductance: float = 0.5, seed: int = None):
+        self.resource_name = "SIM::TEK371::INSTR"
+        self.timeout = 5000
+        self.write_termination = "\n"
+        self.read_termination = "\n"
+
+        self.sweep_time_s = sweep_time_s
+        self.turnaround_s = turnaround_s
+        self.bytes_per_s = bytes_per_s
+        self.noise_codes = noise_codes
+        self.corrupt_rate = corrupt_rate
+        self.gate_voltage = gate_voltage
+        self.threshold_voltage = threshold_voltage
+        self.transconductance = transconductance
+        self._rng = np.random.default_rng(seed)
+        self._random = random.Random(seed)
+
+        self.settings = dict(_INI_SETTINGS)
+        self.memory = {}  # Bubble memory: index -> (preamble, codes)
+        self._view = None  # Bubble memory index shown in view mode
+        self._live = None  # (preamble, codes) of the last measured curve
+        self._output = bytearray()
+        self._lock = threading.Lock()
+        self._sweep_timer = None
+
+        # --- Events ---
+        self._handler = None
+        self._user_handle = None
+        self._srq_enabled = False
+
+    # -----------------------------
+    # VISA resource interface
+    # -----------------------------
+
+    def write(self, message: str) -> None:
+        time.sleep(self.turnaround_s)
+        if self.write_termination and message.endswith(self.write_termination):
+            message = message[:-len(self.write_termination)]
+        for command in message.split(";"):
+            command = command.strip()
+            if command:
+                self._execute(command)
+
+    def query(self, message: str) -> str:
+        self.write(message)
+        return self.read()
+
+    def read(self) -> str:
+        with self._lock:
+            termination = self.read_termination.encode() if self.read_termination else b""
+            end = self._output.find(termination) if termination else -1
+            if end < 0:
+                data, self._output = bytes(self._output), bytearray()
+            else:
+                data = bytes(self._output[:end])
+                del self._output[:end + len(termination)]
+        self._transfer_delay(len(data))
+        return data.decode("ascii", errors="replace")
+
+    def read_bytes(self, count: int, chunk_size: int = None, break_on_termchar: bool = False) -> bytes:
+        with self._lock:
+            data = bytes(self._output[:count])
+            del self._output[:count]
+        self._transfer_delay(len(data))
+        return data
+
+    def read_raw(self, size: int = None) -> bytes:
+        with self._lock:
+            data, self._output = bytes(self._output), bytearray()
+        self._transfer_delay(len(data))
+        return data
+
+    def close(self) -> None:
+        if self._sweep_timer is not None:
+            self._sweep_timer.cancel()
+
+    def wrap_handler(self, callable_):
+        return callable_
+
+    def install_handler(self, event_type, handler, user_handle=None):
+        if event_type == VI_EVENT_SERVICE_REQ:
+            self._handler = handler
+            self._user_handle = user_handle
+        return user_handle
+
+    def uninstall_handler(self, event_type, handler, user_handle=None) -> None:
+        if event_type == VI_EVENT_SERVICE_REQ:
+            self._handler = None
+            self._user_handle = None
+
+    def enable_event(self, event_type, mechanism, context=None) -> None:
+        if event_type == VI_EVENT_SERVICE_REQ:
+            self._srq_enabled = True
+
+    def disable_event(self, event_type, mechanism) -> None:
+        self._srq_enabled = False
+
+    def discard_events(self, event_type, mechanism) -> None:
+        pass
+
+    # -----------------------------
+    # Command interpreter
+    # -----------------------------
+
+    def _execute(self, command: str) -> None:
+        header, _, argument = command.partition(" ")
+        header = header.upper()
+        argument = argument.strip()
+        s = self.settings
+
+        # --- Queries ---
+        if header.endswith("?"):
+            if header == "CUR?":
+                self._respond(self._curve_block())
+            elif header == "WAV?":
+                preamble, _ = self._displayed()
+                self._respond(preamble.encode() + b";" + self._curve_block())
+            else:
+                self._respond((self._answer(header, argument) + self.read_termination).encode())
+            return
+
+        # --- Commands ---
+        if header == "INI":
+            self.settings = dict(_INI_SETTINGS)
+            self._view = None
+        elif header == "CSP":
+            s["csp"] = "PNP" if argument in ("PNP", "NEG") else "NPN"
+        elif header == "PKP":
+            s["pkp"] = int(argument)
+        elif header == "VCS":
+            s["vcs"] = float(argument)
+        elif header == "HOR":
+            source, _, value = argument.partition(":")
+            s["hor_source"] = "STPGEN" if source == "STP" else "COLLECT"
+            s["hor"] = float(value)
+        elif header == "VER":
+            s["ver"] = float(argument.partition(":")[2])
+        elif header == "STP":
+            self._step_command(argument)
+        elif header == "MEA":
+            s["mea"] = _MEASURE_NAMES.get(argument, argument)
+            if argument in ("SIN", "SWE", "SSW"):
+                self._start_sweep()
+        elif header == "DIS":
+            self._display_command(argument)
+        elif header == "ENT":
+            preamble, codes = self._displayed()
+            index = int(argument)
+            self.memory[index] = (preamble.replace('"INDEX 0/', f'"INDEX {index}/', 1), codes)
+        elif header in ("OPC", "RQS", "DEB"):
+            s[header.lower()] = argument
+        elif header == "TEX":
+            s["text"] = argument.strip('"')
+        elif header == "WFM" and argument.startswith("NR.PT:"):
+            s["nr_pt"] = int(argument.partition(":")[2])
+        elif header == "CURS":
+            s["cursor"] = "OFF"
+        else:
+            # DOT, LIN, WIN, SAV, REC, PLO... are accepted and ignored
+            logger.debug("Simulated 371 ignored command: %s", command)
+
+    def _step_command(self, argument: str) -> None:
+        s = self.settings
+        key, _, value = argument.partition(":")
+        if key == "OUT":
+            s["stp_out"] = value
+        elif key in ("CUR", "VOL"):
+            s["stp_type"] = "CURRENT" if key == "CUR" else "VOLTAGE"
+            s["stp_size"] = float(value)
+        elif key == "NUM":
+            s["stp_num"] = int(value)
+        elif key == "INV":
+            s["stp_inv"] = value
+        elif key == "MUL":
+            s["stp_mul"] = value
+        elif key == "OFF":
+            if value in ("ON", "OFF"):
+                s["stp_off_mode"] = value
+            else:
+                # The offset is a multiple of the step size: 0 to 5, or 0 to 500 with step multiplication ON
+                offset = float(value)
+                if 0.0 <= offset <= (500.0 if s["stp_mul"] == "ON" else 5.0):
+                    s["stp_offset"] = offset
+                else:
+                    logger.warning("Simulated 371 rejected out of range step offset: STP OFF:%s", value)
+
+    def _display_command(self, argument: str) -> None:
+        s = self.settings
+        key, _, value = argument.partition(":")
+        if key in _DISPLAY_NAMES:
+            s["display"] = _DISPLAY_NAMES[key]
+            self._view = None
+        elif key in ("VIE", "COM"):
+            s["display"] = f"{'VIEW' if key == 'VIE' else 'COMPARE'}:{value}"
+            self._view = int(value)
+        elif key == "INV":
+            s["dis_inv"] = value
+        elif key == "CAL":
+            s["dis_cal"] = value
+
+    def _answer(self, header: str, argument: str) -> str:
+        s = self.settings
+        stepgen = (f"STEPGEN OUT:{s['stp_out']},NUMBER:{s['stp_num']},OFFSET:{s['stp_offset']:.2f},"
+                   f"INVERT:{s['stp_inv']},MULT:{s['stp_mul']},{s['stp_type']}:{s['stp_size']:.2E}")
+        display = f"DISPLAY INVERT:{s['dis_inv']},CAL:{_CAL_NAMES.get(s['dis_cal'], s['dis_cal'])},{s['display']}"
+        answers = {
+            "ID?": "ID SONY_TEK/371,V81.1F SIM",
+            "HEL?": "HELP READOUT,TEXT,LINE,DOT,WINDOW,CURSOR,DISPLAY,HORIZ,VERT,STEPGEN,MEASURE,ENTER,RECALL,SAVE,"
+                    "PLOT,PSTATUS,PKPOWER,CSPOL,CSOUT,VCSPPLY,OUTPUTS,WFMPRE,CURVE,WAVFRM,RQS,OPC,EVENT,TEST,INIT,"
+                    "ID,DEBUG,SET",
+            "TES?": "TEST ROM:0000,RAM:0000",
+            "CSO?": "CSO BOTH",
+            "CSP?": f"CSPOL {s['csp']}",
+            "PKP?": f"PKPOWER {s['pkp']}",
+            "VCS?": f"VCSPPLY {s['vcs']:.1f}",
+            "HOR?": f"HORIZ {s['hor_source']}:{s['hor']:.2E}",
+            "VER?": f"VERT COLLECT:{s['ver']:.2E}",
+            "STP?": stepgen,
+            "MEA?": f"MEASURE {s['mea']}",
+            "DIS?": display,
+            "OPC?": f"OPC {s['opc']}",
+            "RQS?": f"RQS {s['rqs']}",
+            "DEB?": f"DEBUG {s['deb']}",
+            "TEX?": f'TEXT "{s["text"]}"',
+            "EVE?": "EVENT 000",
+            "OUT?": "OUTPUTS ENABLED",
+            "PST?": "PSTATUS READY",
+            "WFM?": self._displayed()[0] if not argument else f"WFM? NR.PT:{s['nr_pt'] or self._displayed()[1].shape[0]}",
+            "SET?": ";".join([f"OPC {s['opc']}", f"RQS {s['rqs']}", f"PKPOWER {s['pkp']}", f"CSPOL {s['csp']}",
+                              f"HORIZ {s['hor_source']}:{s['hor']:.2E}", f"VERT COLLECT:{s['ver']:.2E}", stepgen,
+                              f"VCSPPLY {s['vcs']:.1f}", f"MEASURE {s['mea']}", display, f"CURSOR {s['cursor']}"]),
+        }
+        return answers.get(header, "")
+
+    def _respond(self, data: bytes) -> None:
+        with self._lock:
+            self._output += data
+
+    def _transfer_delay(self, n_bytes: int) -> None:
+        if self.bytes_per_s:
+            time.sleep(n_bytes / self.bytes_per_s)
+
+    # -----------------------------
+    # Measurement model
+    # -----------------------------
+
+    def _start_sweep(self) -> None:
+        if self._sweep_timer is not None:
+            self._sweep_timer.cancel()
+        self._sweep_timer = threading.Timer(self.sweep_time_s, self._complete_sweep)
+        self._sweep_timer.daemon = True
+        self._sweep_timer.start()
+
+    def _complete_sweep(self) -> None:
+        self._live = self._measure()
+        if (self.settings["opc"] == "ON" and self.settings["rqs"] == "ON"
+                and self._srq_enabled and self._handler is not None):
+            self._handler(self, VI_EVENT_SERVICE_REQ, self._user_handle)
+
+    def _displayed(self) -> tuple:
+        """(preamble, codes) of the curve shown: the viewed memory location or the live curve."""
+        if self._view is not None and self._view in self.memory:
+            return self.memory[self._view]
+        if self._live is None:
+            self._live = self._measure()
+        return self._live
+
+    def _measure(self) -> tuple:
+        """Simulate a sweep of the collector supply and return (preamble, codes)."""
+        s = self.settings
+        n_curves = s["stp_num"] + 1
+        nr_pt = s["nr_pt"] or (256 if n_curves == 1 else 1024)
+        xmult = s["hor"] / 100  # 100 codes per division
+        ymult = s["ver"] / 100
+        vce_max = s["vcs"] / 100 * (30.0 if s["pkp"] >= 300 else 3000.0)
+
+        codes = np.empty((nr_pt, 2), dtype=np.uint16)
+        for k, idx in enumerate(np.array_split(np.arange(nr_pt), n_curves)):
+            vge = self.gate_voltage if n_curves == 1 else (s["stp_offset"] + k) * s["stp_size"]
+            ic_sat = self.transconductance * max(vge - self.threshold_voltage, 0.0) ** 2
+            # The 371 sends the higher currents first
+            vce = np.linspace(vce_max, 0.0, len(idx))
+            ic = ic_sat * np.tanh(np.clip(vce - 0.7, 0.0, None) / 1.5)
+            x = vce / xmult + self._rng.normal(0.0, self.noise_codes, len(idx))
+            y = ic / ymult + self._rng.normal(0.0, self.noise_codes, len(idx))
+            codes[idx, 0] = np.clip(np.rint(x), 0, 1023)
+            codes[idx, 1] = np.clip(np.rint(y), 0, 1023)
+
+        # The readout gives the offset in V or A, i.e. the offset setting times the step size
+        wfid = (f"INDEX 0/VERT {s['ver']:.1E}/HORIZ {s['hor']:.1E}/STEP {s['stp_size']:.1E}"
+                f"/OFFSET {s['stp_offset'] * s['stp_size']:.1E}/BGM 0/VCS {s['vcs']:.1f}/TEXT {s['text']}/HSNS VCE")
+        preamble = (f'WFMPRE WFID:"{wfid}",ENCDG:BIN,NR.PT:{nr_pt},PT.FMT:XY,XMULT:{xmult:.3E},XZERO:0,XOFF:0,'
+                    f"XUNIT:V,YMULT:{ymult:.3E},YZERO:0,YOFF:0,YUNIT:A,BYT/NR:2,BN.FMT:RP,BIT/NR:10,"
+                    f"CRVCHK:CHKSM0,LN.FMT:VECTOR")
+        return preamble, codes
+
+    def _curve_block(self) -> bytes:
+        """CURVE response: header, count, points and checksum."""
+        _, codes = self._displayed()
+        index = self._view or 0
+        head = (f'CURVE CURVID:"INDEX {index}"'.ljust(CURVE_HEAD_LEN - 2) + ",%").encode()
+        data = bytearray((codes.shape[0] + 1).to_bytes(2, "big"))
+        data += codes.astype(">u2").tobytes()
+        checksum = (-sum(data)) % 256
+        if self.corrupt_rate and self._random.random() < self.corrupt_rate:
+            data[2 + self._random.randrange(len(data) - 2)] ^= 0x01
+        return head + bytes(data) + bytes([checksum])
+
+
+class _SimulatedAdapter:
+    def close(self) -> None:
+        pass
+
+
+class SimulatedKeithley2400:
+    """
+    Simulated PyMeasure Keithley2400, with the attributes and methods used by the scripts.
+
+    When sourcing current, the measured voltage follows the calibrated TSEP of the scripts
+    (Vce at 150 mA against junction temperature), so the Tj scripts produce sensible values.
+
+    Args:
+        adapter (str): GPIB address, only kept for reference.
+        junction_temperature (float): Simulated junction temperature of the DUT in °C.
+        noise_v (float): Standard deviation of the voltage measurement noise.
+        nplc_time_s (float): Time taken by one measurement per power line cycle.
+    """
+
+    def __init__(self, adapter: str = "SIM::KEITHLEY2400", junction_temperature: float = 25.0,
+                 noise_v: float = 50e-6, nplc_time_s: float = 0.02):
+        self.adapter = _SimulatedAdapter()
+        self.address = adapter
+        self.junction_temperature = junction_temperature
+        self.noise_v = noise_v
+        self.nplc_time_s = nplc_time_s
+        self.nplc = 1
+        self.source_mode = "voltage"
+        self.source_voltage = 0.0
+        self.source_current = 0.0
+        self.compliance_current = 1e-3
+        self.compliance_voltage = 20.0
+        self.wires = 2
+        self.source_enabled = False
+        self._buffer_points = 0
+        self._buffer = []
+
+    @property
+    def id(self) -> str:
+        return "KEITHLEY INSTRUMENTS INC.,MODEL 2400,SIMULATED,C30"
+
+    def write(self, command: str) -> None:
+        pass
+
+    def reset(self) -> None:
+        self.source_mode = "voltage"
+        self.source_voltage = 0.0
+        self.source_current = 0.0
+        self.source_enabled = False
+
+    def use_front_terminals(self) -> None:
+        pass
+
+    def enable_source(self) -> None:
+        self.source_enabled = True
+
+    def disable_source(self) -> None:
+        self.source_enabled = False
+
+    def beep(self, frequency: float, duration: float) -> None:
+        pass
+
+    def apply_current(self, current_range: float = None, compliance_voltage: float = 0.1) -> None:
+        self.source_mode = "current"
+        self.compliance_voltage = compliance_voltage
+
+    def measure_voltage(self, nplc: float = 1, voltage: float = 21.0, auto_range: bool = True) -> None:
+        self.nplc = nplc
+
+    def config_buffer(self, points: int = 64, delay: float = 0) -> None:
+        self._buffer_points = points
+        self._buffer = []
+
+    def start_buffer(self) -> None:
+        self._buffer = [self.voltage for _ in range(self._buffer_points)]
+
+    def wait_for_buffer(self, should_stop=lambda: False, timeout: float = 60, interval: float = 0.1) -> None:
+        pass
+
+    @property
+    def voltage(self) -> float:
+        time.sleep(self.nplc * self.nplc_time_s)
+        if not self.source_enabled:
+            return 0.0
+        if self.source_mode == "current":
+            # Inverse of the H40ER5S dev 10 calibration used by the Tj scripts
+            v = (357.090847511229 - self.junction_temperature) / 532.214573058354
+        else:
+            v = self.source_voltage
+        return v + random.gauss(0.0, self.noise_v)
+
+    @property
+    def mean_voltage(self) -> float:
+        return sum(self._buffer) / len(self._buffer) if self._buffer else 0.0
@@ -0,0 +1,108 @@
+"""
+sinks.py
+Destinations for acquired curves. Every sink exposes write(curve, filename) and the
+file extension it produces, so the acquisition scripts can switch output format freely.
+"""
+import csv
+
+import numpy as np
+
+from .curve import Curve
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+class CsvSink:
+    """Writes the scaled points as a two-column CSV file, as read_curve always did."""
+
+    extension = ".csv"
+
+    def write(self, curve: Curve, filename: str) -> None:
+        with open(filename, "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(["Voltage (V)", "Current (A)"])
+            writer.writerows(curve.points.tolist())
+        logger.info(f"Curve saved to {filename}")
+
+
+class BinarySink:
+    """
+    Writes the curve to a NumPy .npz file: voltage, current, raw codes, timestamp and
+    the preamble with its scaling values. Much smaller and faster to load than the CSV output.
+    """
+
+    extension = ".npz"
+
+    def write(self, curve: Curve, filename: str) -> None:
+        with open(filename, "wb") as f:
+            np.savez(
+                f,
+                voltage=curve.voltage,
+                current=curve.current,
+                codes=curve.codes,
+                timestamp=curve.timestamp,
+                step=np.nan if curve.step is None else curve.step,
+                preamble=curve.preamble.raw,
+                nr_pt=curve.preamble.nr_pt,
+                xmult=curve.preamble.xmult,
+                xoff=curve.preamble.xoff,
+                ymult=curve.preamble.ymult,
+                yoff=curve.preamble.yoff,
+            )
+        logger.info(f"Curve saved to {filename}")
+
+
+class RawSink:
+    """
+    Writes only what the 371 sent: the raw uint16 X/Y codes, in their original order, and the
+    preamble they are scaled with (as ASCII bytes), plus timestamp and step, in a compressed
+    .npz. Voltage and current are rebuilt exactly when the file is read back with Curve.load.
+    """
+
+    extension = ".npz"
+
+    def write(self, curve: Curve, filename: str) -> None:
+        with open(filename, "wb") as f:
+            np.savez_compressed(
+                f,
+                codes=curve.codes,
+                preamble=np.frombuffer(curve.preamble.raw.encode("ascii"), dtype=np.uint8),
+                timestamp=curve.timestamp,
+                step=np.nan if curve.step is None else curve.step,
+            )
+        logger.info(f"Curve saved to {filename}")
+
+
+class NullSink:
+    """Discards the curve. Useful when only the in-memory result is needed."""
+
+    extension = ""
+
+    def write(self, curve: Curve, filename: str) -> None:
+        pass
+
+
+SINKS = {
+    "csv": CsvSink,
+    "binary": BinarySink,
+    "raw": RawSink,
+    "none": NullSink,
+}
+
+
+def get_sink(name: str):
+    """
+    Create a sink by name.
+
+    Args:
+        name (str): Output format. Accepted values:
+            - "csv"
+            - "binary"
+            - "raw"
+            - "none"
+    """
+    try:
+        return SINKS[name]()
+    except KeyError:
+        raise ValueError(f"Unknown curve sink '{name}', expected one of {sorted(SINKS)}.") from None
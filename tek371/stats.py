@@ -0,0 +1,161 @@
+"""
+stats.py
+Point-by-point statistics of repeated curves, accumulated online as each curve arrives.
+"""
+import csv
+import math
+from statistics import NormalDist
+
+import numpy as np
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+def t_quantile(p: float, dof: int) -> float:
+    """
+    Quantile of Student's t distribution: exact for 1 and 2 degrees of freedom, otherwise from the
+    Cornish-Fisher expansion around the normal one (within 1 % from 3 degrees of freedom, 0.1 % from 6).
+
+    Args:
+        p (float): Probability, e.g. 0.975 for a two-sided 95 % interval.
+        dof (int): Degrees of freedom.
+    """
+    if dof < 1:
+        return math.nan
+    if dof == 1:
+        return math.tan(math.pi * (p - 0.5))
+    if dof == 2:
+        return (2 * p - 1) / math.sqrt(2 * p * (1 - p))
+    z = NormalDist().inv_cdf(p)
+    return (z + (z ** 3 + z) / (4 * dof)
+            + (5 * z ** 5 + 16 * z ** 3 + 3 * z) / (96 * dof ** 2)
+            + (3 * z ** 7 + 19 * z ** 5 + 17 * z ** 3 - 15 * z) / (384 * dof ** 3))
+
+
+def write_stats_table(filename: str, count: int, mean: np.ndarray, std: np.ndarray, minimum: np.ndarray,
+                      maximum: np.ndarray, confidence: float = 0.95) -> None:
+    """
+    Write the mean, standard deviation, min/max and confidence band of every point of count curves.
+
+    This is the layout of every {base_name}_STATS.csv file, whether the statistics were
+    accumulated during the acquisition or computed afterwards from the saved curves.
+
+    Args:
+        filename (str): Path of the CSV file.
+        count (int): Number of curves.
+        mean, std, minimum, maximum (numpy.ndarray): Arrays of shape (points, 2).
+        confidence (float): Confidence level of the band, e.g. 0.95.
+    """
+    half_width = t_quantile(0.5 + confidence / 2, count - 1) * std / math.sqrt(count)
+    level = f"{confidence * 100:g}%"
+    header = []
+    for name, unit in (("Voltage", "V"), ("Current", "A")):
+        header += [f"{name} mean ({unit})", f"{name} std ({unit})", f"{name} min ({unit})", f"{name} max ({unit})",
+                   f"{name} CI{level} low ({unit})", f"{name} CI{level} high ({unit})"]
+    columns = [mean, std, minimum, maximum, mean - half_width, mean + half_width]
+    table = np.column_stack([column[:, 0] for column in columns] + [column[:, 1] for column in columns])
+    with open(filename, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(header)
+        writer.writerows(table.tolist())
+    logger.info(f"Statistics of {count} curves saved to {filename}")
+
+
+class CurveStatistics:
+    """
+    Welford accumulator of the voltage and current of every point over repeated curves.
+
+    Memory is O(points) whatever the number of curves, and each update is a handful of
+    vectorized operations, so it can run on the CurvePipeline worker as curves arrive.
+
+    Example:
+        stats = CurveStatistics()
+        for curve in curves:
+            stats.update(curve)
+        stats.write_mean("mean/run_MEAN.csv")
+
+    All statistics are arrays of shape (points, 2), voltage in column 0 and current in column 1.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self._mean = None
+        self._m2 = None  # Sum of squared differences from the mean
+        self._min = None
+        self._max = None
+
+    def update(self, curve) -> None:
+        """
+        Add a curve.
+
+        Args:
+            curve (Curve | numpy.ndarray): Curve, or array of (voltage, current) points of shape (points, 2).
+
+        Raises:
+            ValueError: If the number of points differs from the previous curves.
+        """
+        points = curve.points if hasattr(curve, "points") else np.asarray(curve, dtype=np.float64)
+        if self._mean is None:
+            self.count = 1
+            self._mean = points.astype(np.float64, copy=True)
+            self._m2 = np.zeros_like(self._mean)
+            self._min = self._mean.copy()
+            self._max = self._mean.copy()
+            return
+        if points.shape != self._mean.shape:
+            raise ValueError(f"Curve of {len(points)} points does not match the previous ones ({len(self._mean)}).")
+        self.count += 1
+        delta = points - self._mean
+        self._mean += delta / self.count
+        self._m2 += delta * (points - self._mean)
+        np.minimum(self._min, points, out=self._min)
+        np.maximum(self._max, points, out=self._max)
+
+    @property
+    def mean(self) -> np.ndarray:
+        return self._mean
+
+    @property
+    def variance(self) -> np.ndarray:
+        """Sample variance (n - 1 in the denominator), NaN with fewer than 2 curves."""
+        if self.count < 2:
+            return np.full_like(self._mean, np.nan)
+        return self._m2 / (self.count - 1)
+
+    @property
+    def std(self) -> np.ndarray:
+        return np.sqrt(self.variance)
+
+    @property
+    def minimum(self) -> np.ndarray:
+        return self._min
+
+    @property
+    def maximum(self) -> np.ndarray:
+        return self._max
+
+    def confidence_band(self, confidence: float = 0.95) -> tuple:
+        """
+        Confidence interval of the mean of every point, from Student's t distribution.
+
+        Args:
+            confidence (float): Confidence level, e.g. 0.95.
+
+        Returns:
+            tuple: (low, high) arrays of shape (points, 2).
+        """
+        half_width = t_quantile(0.5 + confidence / 2, self.count - 1) * self.std / math.sqrt(self.count)
+        return self._mean - half_width, self._mean + half_width
+
+    def write_mean(self, filename: str) -> None:
+        """Write the mean curve with the same two columns as the curve files."""
+        with open(filename, "w", newline="", encoding="utf-8") as f:
+            writer = csv.writer(f)
+            writer.writerow(["Voltage (V)", "Current (A)"])
+            writer.writerows(self._mean.tolist())
+        logger.info(f"Mean curve of {self.count} curves saved to {filename}")
+
+    def write_stats(self, filename: str, confidence: float = 0.95) -> None:
+        """Write mean, standard deviation, min/max and confidence band of every point."""
+        write_stats_table(filename, self.count, self._mean, self.std, self._min, self._max, confidence)
@@ -0,0 +1,81 @@
+"""
+timeouts.py
+Per-operation VISA timeouts sized from the number of bytes expected and a running estimate
+of the bus latency and throughput.
+
+Only transfers of a known size (the binary curve blocks) are sized this way: the time the 371
+takes to process a command or prepare a text response is not modelled, so those keep the
+fixed default timeout.
+"""
+import logging
+logger = logging.getLogger(__name__)
+
+
+class AdaptiveTimeout:
+    """
+    Estimates the latency (time to first byte, including the 371 processing) and the throughput
+    of the bus from the transfers actually made, with exponentially weighted moving averages,
+    and turns them into a timeout for the next operation:
+
+        timeout = margin * (latency + expected_bytes / throughput), within [min_ms, max_ms]
+
+    Until enough transfers have been seen, the fixed default timeout is used.
+
+    Args:
+        default_ms (int): Timeout used while there is no estimate, and after reset.
+        min_ms (int): Lower bound of any adaptive timeout.
+        max_ms (int): Upper bound of any adaptive timeout.
+        margin (float): Multiple of the expected duration allowed before timing out.
+        alpha (float): Weight of every new sample in the moving averages.
+        min_sample_bytes (int): Transfers of at least this size update the throughput, shorter
+            ones the latency.
+    """
+
+    def __init__(self, default_ms: int, min_ms: int = 250, max_ms: int = 60000, margin: float = 4.0,
+                 alpha: float = 0.25, min_sample_bytes: int = 512):
+        self.default_ms = default_ms
+        self.min_ms = min_ms
+        self.max_ms = max_ms
+        self.margin = margin
+        self.alpha = alpha
+        self.min_sample_bytes = min_sample_bytes
+        self.latency_s = None  # Estimated time to first byte
+        self.throughput_bps = None  # Estimated bytes per second
+
+    def timeout_ms(self, expected_bytes: int = None) -> int:
+        """
+        Timeout for an operation transferring expected_bytes.
+
+        Args:
+            expected_bytes (int): Bytes to be read, None if unknown or for a command or text query,
+                which get the default timeout.
+
+        Returns:
+            int: Timeout in milliseconds.
+        """
+        if expected_bytes is None or self.latency_s is None:
+            return self.default_ms
+        if self.throughput_bps is None:
+            if expected_bytes >= self.min_sample_bytes:
+                return self.default_ms  # No idea yet how long a large transfer takes
+            duration = self.latency_s
+        else:
+            duration = self.latency_s + expected_bytes / self.throughput_bps
+        return int(min(max(self.margin * duration * 1000, self.min_ms), self.max_ms))
+
+    def update(self, n_bytes: int, elapsed_s: float) -> None:
+        """Account a completed transfer of n_bytes that took elapsed_s."""
+        if n_bytes < self.min_sample_bytes:
+            self.latency_s = self._average(self.latency_s, elapsed_s)
+            return
+        transfer_s = elapsed_s - (self.latency_s or 0.0)
+        if transfer_s > 0:
+            self.throughput_bps = self._average(self.throughput_bps, n_bytes / transfer_s)
+
+    def reset(self) -> None:
+        """Forget the estimates, e.g. after a timeout, so the default timeout is used again."""
+        self.latency_s = None
+        self.throughput_bps = None
+
+    def _average(self, current, sample: float) -> float:
+        return sample if current is None else current + self.alpha * (sample - current)
@@ -0,0 +1,36 @@
+import numpy as np
+
+from tek371.container import RunReader, RunWriter
+from tek371.curve import Curve
+
+PREAMBLE = ('WFMPRE WFID:"INDEX 0/VERT 5.0E+0/HORIZ 2.0E-1/STEP 1.0E+0/OFFSET 0.0E+0/BGM 0/VCS 100.0/TEXT /HSNS VCE",'
+            "ENCDG:BIN,NR.PT:4,PT.FMT:XY,XMULT:2.000E-3,XZERO:0,XOFF:0,XUNIT:V,YMULT:5.000E-2,YZERO:0,YOFF:0,"
+            "YUNIT:A,BYT/NR:2,BN.FMT:RP,BIT/NR:10,CRVCHK:CHKSM0,LN.FMT:VECTOR")
+
+
+def _curve(offset: int) -> Curve:
+    codes = np.array([[400, 300], [300, 200], [200, 100], [100, 0]], dtype=np.uint16) + offset
+    return Curve.from_codes(codes, PREAMBLE, timestamp=1.0)
+
+
+def test_appended_curves_are_readable_before_close(tmp_path):
+    filename = str(tmp_path / "run.t371")
+    run = RunWriter(filename, metadata={"DUT": "test"})
+    run.append(_curve(0), index=1)
+    run.append(_curve(1), index=2)
+
+    with RunReader(filename) as reader:
+        assert reader.indices == [1, 2]
+        np.testing.assert_array_equal(reader.codes(1), _curve(1).codes)
+    run.close()
+
+
+def test_curves_outlive_the_reader(tmp_path):
+    filename = str(tmp_path / "run.t371")
+    with RunWriter(filename) as run:
+        run.append(_curve(0))
+
+    reader = RunReader(filename)
+    curve = reader.curve(0)
+    reader.close()
+    np.testing.assert_array_equal(curve.codes, _curve(0).codes)
@@ -0,0 +1,48 @@
+import numpy as np
+import pytest
+
+from tek371.curve import CURVE_HEAD_LEN, decode_family, family_starts
+
+PREAMBLE = ('WFMPRE WFID:"INDEX 0/VERT 5.0E+0/HORIZ 2.0E-1/STEP 2.0E+0/OFFSET 1.0E+1/BGM 0/VCS 100.0/TEXT /HSNS VCE",'
+            "ENCDG:BIN,NR.PT:{nr_pt},PT.FMT:XY,XMULT:2.000E-3,XZERO:0,XOFF:0,XUNIT:V,YMULT:5.000E-2,YZERO:0,YOFF:0,"
+            "YUNIT:A,BYT/NR:2,BN.FMT:RP,BIT/NR:10,CRVCHK:CHKSM0,LN.FMT:VECTOR")
+
+
+def _sweep(n: int, peak_current: int, rng) -> np.ndarray:
+    """One collector sweep from its peak down to zero, with a few codes of noise."""
+    x = np.linspace(1000, 0, n) + rng.integers(-3, 4, n)
+    y = np.linspace(peak_current, 0, n) + rng.integers(-3, 4, n)
+    return np.clip(np.column_stack([x, y]), 0, 1023).astype(np.uint16)
+
+
+def _curve_block(codes: np.ndarray) -> bytes:
+    head = b'CURVE CURVID:"INDEX 0"'.ljust(CURVE_HEAD_LEN - 2) + b",%"
+    data = (len(codes) + 1).to_bytes(2, "big") + codes.astype(">u2").tobytes()
+    return head + data + bytes([-sum(data) % 256])
+
+
+def test_family_split_at_each_sweep_restart():
+    # Curves of different lengths, unlike an even split of NR.PT
+    rng = np.random.default_rng(0)
+    sweeps = [_sweep(n, peak, rng) for n, peak in ((70, 200), (45, 400), (90, 600))]
+    codes = np.concatenate(sweeps)
+
+    np.testing.assert_array_equal(family_starts(codes, 3), [70, 115])
+
+    curves = decode_family(_curve_block(codes), PREAMBLE.format(nr_pt=len(codes)), 3, timestamp=0.0)
+    assert [len(curve.codes) for curve in curves] == [70, 45, 90]
+    assert [curve.step for curve in curves] == [10.0, 12.0, 14.0]
+    for curve, sweep in zip(curves, sweeps):
+        np.testing.assert_array_equal(curve.codes, sweep)
+
+
+def test_family_without_enough_restarts():
+    rng = np.random.default_rng(1)
+    codes = np.concatenate([_sweep(60, 300, rng), _sweep(60, 500, rng)])
+    with pytest.raises(ValueError):
+        family_starts(codes, 3)
+
+
+def test_single_curve_family():
+    codes = _sweep(10, 100, np.random.default_rng(2))
+    assert len(family_starts(codes, 1)) == 0
@@ -0,0 +1,65 @@
+import numpy as np
+import pytest
+
+from tek371.postprocess import collapse_ties, load_curve_file, resample, write_summary
+
+
+def test_collapse_ties_averages_repeated_x():
+    x, y = collapse_ties(np.array([0.0, 1.0, 1.0, 1.0, 2.0, 3.0, 3.0]),
+                         np.array([0.0, 1.0, 2.0, 3.0, 4.0, 5.0, 7.0]))
+    np.testing.assert_array_equal(x, [0.0, 1.0, 2.0, 3.0])
+    np.testing.assert_array_equal(y, [0.0, 2.0, 4.0, 6.0])
+
+
+def test_resample_with_tied_currents():
+    # 10-bit current codes: several voltages per current value, in both repeats
+    current = np.array([0.0, 0.0, 0.5, 0.5, 0.5, 1.0, 1.5, 1.5, 2.0])
+    voltage = np.linspace(0.0, 0.8, len(current))
+    first = np.column_stack([voltage, current])
+    second = np.column_stack([voltage + 0.1, current])
+
+    resampled = resample(np.stack([first, second]), "current", points=5)
+
+    grid = np.linspace(0.0, 2.0, 5)
+    _, expected = collapse_ties(current, voltage)
+    expected = np.interp(grid, np.unique(current), expected)
+    np.testing.assert_allclose(resampled[:, :, 1], [grid, grid])
+    np.testing.assert_allclose(resampled[0, :, 0], expected)
+    np.testing.assert_allclose(resampled[1, :, 0], expected + 0.1)
+    assert np.all(np.diff(resampled[0, :, 0]) >= 0)
+
+
+def test_resample_curves_of_different_lengths():
+    short = np.column_stack([np.linspace(0, 1, 5), np.linspace(0, 2, 5)])
+    long = np.column_stack([np.linspace(0, 1, 9), np.linspace(0, 2, 9)])
+    resampled = resample([short, long], "current", points=3)
+    np.testing.assert_allclose(resampled[:, :, 0], [[0, 0.5, 1], [0, 0.5, 1]])
+
+
+def test_write_summary_defaults_to_current_grid(tmp_path):
+    # Same curve with the current jittered: averaging by row would mix operating points
+    current = np.linspace(0.0, 2.0, 21)
+    voltage = current ** 2
+    shifted = np.linspace(0.5, 2.5, 21)
+    curves = [np.column_stack([voltage, current]), np.column_stack([shifted ** 2, shifted])]
+
+    mean_path, stats_path = write_summary(curves, str(tmp_path), "run", stats=True)
+
+    mean = np.loadtxt(mean_path, delimiter=",", skiprows=1)
+    np.testing.assert_allclose(mean[:, 0], mean[:, 1] ** 2, atol=3e-3)
+    assert mean[0, 1] == pytest.approx(0.5) and mean[-1, 1] == pytest.approx(2.0)
+    assert stats_path.endswith("run_STATS.csv")
+
+
+def test_load_curve_file_with_spaces(tmp_path):
+    path = tmp_path / "curve_1.csv"
+    path.write_text("Voltage (V), Current (A)\n0.5, 1e-3\r\n 1.0 ,2e-3\n", encoding="utf-8")
+    np.testing.assert_array_equal(load_curve_file(str(path)), [[0.5, 1e-3], [1.0, 2e-3]])
+
+
+@pytest.mark.parametrize("text", ["0.5,1e-3\n1.0,oops\n", "0.5,1e-3,7\n1.0,2e-3,8\n", "0.5\n1.0\n"])
+def test_load_curve_file_rejects_other_tables(tmp_path, text):
+    path = tmp_path / "curve_1.csv"
+    path.write_text("Voltage (V),Current (A)\n" + text, encoding="utf-8")
+    with pytest.raises(ValueError):
+        load_curve_file(str(path))
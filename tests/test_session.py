@@ -0,0 +1,40 @@
+import gc
+
+import pytest
+
+from tek371.session import SessionPool
+
+pytest.importorskip("pyvisa_sim")
+keithley = pytest.importorskip("pymeasure.instruments.keithley")
+
+ADDRESS = "GPIB0::8::INSTR"  # Instrument of the default pyvisa-sim configuration
+
+
+@pytest.fixture
+def pool():
+    pool = SessionPool("@sim")
+    pool.open_resource(ADDRESS, read_termination="\n", write_termination="\n")
+    yield pool
+    pool.close()
+
+
+def test_keithley2400_on_the_pooled_session(pool):
+    smu = pool.instrument(ADDRESS, keithley.Keithley2400)
+    smu.read()  # The simulated instrument answers ERROR to the data format set by Keithley2400
+
+    assert smu.adapter.connection is pool.open_resource(ADDRESS)
+    assert smu.adapter.manager is pool.resource_manager
+    assert smu.ask("?IDN").strip() == "LSG Serial #1234"
+    assert pool.instrument(ADDRESS, keithley.Keithley2400) is smu
+
+
+def test_closing_the_adapter_leaves_the_session_open(pool):
+    session = pool.open_resource(ADDRESS)
+    smu = keithley.Keithley2400(pool.visa_adapter(ADDRESS))
+    smu.read()  # The simulated instrument answers ERROR to the data format set by Keithley2400
+    smu.adapter.close()
+    del smu
+    gc.collect()
+
+    assert pool.open_resource(ADDRESS) is session
+    assert session.query("?IDN").strip() == "LSG Serial #1234"